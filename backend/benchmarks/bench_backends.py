@@ -0,0 +1,74 @@
+"""
+Benchmark: inference backends (PyTorch / ONNX Runtime / OpenVINO) on the same images.
+
+Each model is loaded through services.inference_backends.build_backend, warmed
+up, then timed for single-image latency and batched throughput. Backends whose
+runtime is not installed are reported and skipped.
+
+Export the models first (training/train.py --export WEIGHTS [--int8]), then
+run from backend/:
+    python -m benchmarks.bench_backends yolov8n.pt yolov8n.onnx yolov8n_openvino_model \\
+        --images 64 --batch 8 --threads 4
+"""
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import cv2
+
+from services.inference_backends import build_backend, resolve_backend_name
+from services.metrics import StatSummary
+
+def load_images(source, count, size=(1280, 960), seed=0):
+    if source:
+        paths = sorted(glob.glob(os.path.join(source, "*.jpg")) + glob.glob(os.path.join(source, "*.png")))
+        images = [cv2.imread(p) for p in paths[:count]]
+        if images:
+            return images
+    # Synthetic field frames when no image directory is given
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8) for _ in range(count)]
+
+def bench(model_path, backend, images, batch, threads):
+    try:
+        started = time.perf_counter()
+        engine = build_backend(model_path, backend=backend, threads=threads)
+        load_s = time.perf_counter() - started
+    except ImportError as e:
+        print(f"{model_path:<36} skipped: runtime not installed ({e.name})")
+        return
+    engine.warmup(runs=2)
+
+    latency = StatSummary(window=len(images))
+    for img in images:
+        start = time.perf_counter()
+        engine.predict([img])
+        latency.observe((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for i in range(0, len(images), batch):
+        engine.predict(images[i:i + batch])
+    throughput = len(images) / (time.perf_counter() - start)
+
+    stats = latency.snapshot()
+    print(f"{model_path:<36}{engine.name:>9}{load_s:>8.2f}s{stats['p50']:>9.1f}{stats['p95']:>9.1f}{throughput:>11.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", help="model files (.pt, .onnx, *_openvino_model/)")
+    parser.add_argument("--backend", default="auto", help="force one backend instead of detecting it per file")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--image-dir", default=None, help="real frames to use instead of synthetic ones")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    images = load_images(args.image_dir, args.images)
+    print(f"{len(images)} images, batch {args.batch}, {args.threads} threads")
+    print(f"{'model':<36}{'backend':>9}{'load':>9}{'p50 ms':>9}{'p95 ms':>9}{'img/s':>11}")
+    for model_path in args.models:
+        bench(model_path, resolve_backend_name(model_path, args.backend), images, args.batch, args.threads)
+
+if __name__ == "__main__":
+    main()
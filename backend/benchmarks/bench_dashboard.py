@@ -0,0 +1,69 @@
+"""
+Benchmark: dashboard totals from rollups vs. aggregating the scan tables.
+
+Seeds N scans through crud.create_scan_entries_bulk (which maintains the
+rollups), then times one dashboard read both ways. Uses a throwaway
+database file, never agriscan.db.
+
+Run from backend/:
+    python -m benchmarks.bench_dashboard --scans 200000
+"""
+import os
+import time
+import argparse
+import tempfile
+from sqlalchemy import func
+from sqlalchemy.orm import sessionmaker
+
+import models, crud
+from database import build_engine
+from services import rollups
+from benchmarks.bench_db_writes import sample_entries
+
+def scan_tables(db):
+    """What the dashboard would have to do without rollups."""
+    total, health, pests = db.query(
+        func.count(models.Scan.id), func.avg(models.ScanResult.health_score),
+        func.sum(models.ScanResult.pest_detected_count),
+    ).outerjoin(models.ScanResult, models.ScanResult.scan_id == models.Scan.id).one()
+    yields = [rollups.parse_yield(y) for (y,) in db.query(models.ScanResult.yield_prediction)]
+    yields = [y for y in yields if y is not None]
+    return total, health, pests, sum(yields) / len(yields) if yields else None
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="agriscan_bench_"), "bench.db")
+    engine = build_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    start = time.perf_counter()
+    entries = sample_entries(args.batch)
+    for offset in range(0, args.scans, args.batch):
+        crud.create_scan_entries_bulk(db, entries[:min(args.batch, args.scans - offset)])
+    print(f"Seeded {args.scans} scans in {time.perf_counter() - start:.1f}s")
+
+    full = best_of(lambda: scan_tables(db), repeat=3)
+    rolled = best_of(lambda: rollups.dashboard_stats(db))
+    print(f"{'aggregate scans':<20}{full:>10.1f} ms")
+    print(f"{'rollups':<20}{rolled:>10.2f} ms  ({full / rolled:.0f}x)")
+
+    start = time.perf_counter()
+    rollups.rebuild(db)
+    print(f"{'rebuild':<20}{(time.perf_counter() - start) * 1000:>10.0f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
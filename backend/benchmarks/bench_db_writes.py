@@ -0,0 +1,82 @@
+"""
+Benchmark: scan persistence paths on SQLite.
+
+Compares the original two-commit/three-refresh write, the single-transaction
+crud.create_scan_entry, and crud.create_scan_entries_bulk for a burst of
+uploads. Uses a throwaway database file, never agriscan.db.
+
+Run from backend/:
+    python -m benchmarks.bench_db_writes --scans 500
+"""
+import os
+import time
+import argparse
+import tempfile
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import models, schemas, crud
+
+def legacy_create_scan_entry(db, scan_data, result_data):
+    """The pre-optimisation write path, kept here only as the baseline."""
+    db_scan = models.Scan(**crud._scan_row(scan_data))
+    db.add(db_scan)
+    db.commit()
+    db.refresh(db_scan)
+    db_result = models.ScanResult(scan_id=db_scan.id, **crud._result_row(result_data, result_data.raw_json_output))
+    db.add(db_result)
+    db.commit()
+    db.refresh(db_result)
+    db.refresh(db_scan)
+    return db_scan
+
+def sample_entries(n):
+    raw = {"health_score": 81.0, "pest_count": 2, "pest_detections": [
+        {"id": 1, "label": "Target Spot", "confidence": 0.82, "box": [40.1, 22.5, 3.2, 2.9], "severity": "High"},
+        {"id": 2, "label": "Tomato Leaf Mold", "confidence": 0.64, "box": [71.0, 58.3, 2.1, 2.4], "severity": "Medium"},
+    ]}
+    return [(
+        schemas.ScanCreate(image_path=f"temp/frame_{i:05d}.jpg", user_name="Farmer",
+                           location_lat=20.296, location_lon=85.824),
+        schemas.ScanResultCreate(health_score=81.0, yield_prediction="4.1 Tons/Hectare", pest_detected_count=2,
+                                 yield_value=4.1, yield_unit="Tons/Hectare", yield_trend="Average", yield_confidence=0.85,
+                                 weather_temp=29.0, weather_humidity=70.0, weather_desc="Clouds",
+                                 n_level="Optimal", p_level="Low", k_level="Optimal", raw_json_output=raw),
+    ) for i in range(n)]
+
+def fresh_session():
+    path = os.path.join(tempfile.mkdtemp(prefix="agriscan_bench_"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    counts = {"commits": 0, "statements": 0}
+    event.listen(engine, "commit", lambda conn: counts.__setitem__("commits", counts["commits"] + 1))
+    event.listen(engine, "before_cursor_execute",
+                 lambda *a: counts.__setitem__("statements", counts["statements"] + 1))
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)(), counts
+
+def run(label, write, entries):
+    db, counts = fresh_session()
+    start = time.perf_counter()
+    write(db, entries)
+    elapsed = time.perf_counter() - start
+    db.close()
+    n = len(entries)
+    rows = n * 2
+    print(f"{label:<30}{elapsed:>9.3f}s{counts['commits'] / n:>14.3f}{counts['statements'] / n:>14.2f}{rows / elapsed:>12.0f}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=500)
+    args = parser.parse_args()
+    entries = sample_entries(args.scans)
+
+    print(f"{args.scans} scans (scan + result rows each)")
+    print(f"{'path':<30}{'time':>10}{'commits/scan':>14}{'stmts/scan':>14}{'rows/s':>12}")
+    base = run("legacy (2 commits, 3 refresh)", lambda db, e: [legacy_create_scan_entry(db, s, r) for s, r in e], entries)
+    single = run("create_scan_entry", lambda db, e: [crud.create_scan_entry(db, s, r) for s, r in e], entries)
+    bulk = run("create_scan_entries_bulk", crud.create_scan_entries_bulk, entries)
+    print(f"Speedup vs legacy: single-transaction {base / single:.1f}x, bulk {base / bulk:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: pooled HTTPClientRegistry vs a fresh httpx.AsyncClient per call,
+against a local OpenWeather-compatible stub server (no network needed).
+
+Run from backend/:
+    python -m benchmarks.bench_http_pool --requests 500 --concurrency 50
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_PAYLOAD = json.dumps({
+    "main": {"temp": 29.4, "humidity": 71},
+    "weather": [{"main": "Clouds", "description": "scattered clouds"}],
+    "name": "Stub Field",
+}).encode()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections += 1
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(STUB_PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+def start_stub(latency):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+async def run(label, call, requests, concurrency):
+    StubHandler.connections = 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            await call()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:<26}{elapsed:>9.2f}s{requests / elapsed:>10.0f} req/s{StubHandler.connections:>8} TCP conns")
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = start_stub(args.latency_ms / 1000)
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ["OPENWEATHER_BASE_URL"] = base
+    os.environ["OPENWEATHER_API_KEY"] = "stub"
+
+    import httpx
+    from services.http_client import http_registry
+    from services import weather_service
+
+    url = f"{base}/data/2.5/weather?lat=20.3&lon=85.8&appid=stub&units=metric"
+
+    async def fresh_client():
+        async with httpx.AsyncClient() as client:
+            await client.get(url, timeout=5.0)
+
+    print(f"{'client':<26}{'time':>10}{'throughput':>16}{'':>8}")
+    await run("fresh AsyncClient / call", fresh_client, args.requests, args.concurrency)
+
+    await http_registry.startup()
+    await run("shared registry", lambda: weather_service._fetch_openweather(20.3, 85.8),
+              args.requests, args.concurrency)
+    print(f"Registry stats: {json.dumps(http_registry.stats())}")
+    await http_registry.shutdown()
+    server.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Benchmark: /api/v1/scans listing at scale.
+
+Seeds N scans (default 1M) into a throwaway SQLite file, then times one
+page at increasing depths for:
+  baseline  - no timestamp index, ORM OFFSET/LIMIT, lazy-loaded results (1 + N queries)
+  optimized - composite indexes, keyset cursor, one joined column projection
+
+Run from backend/:
+    python -m benchmarks.bench_scan_listing --rows 1000000
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from sqlalchemy import event, text
+from sqlalchemy.orm import sessionmaker
+
+import models, crud
+from database import build_engine
+
+NEW_INDEXES = ("ix_scans_timestamp_id", "ix_scans_user_timestamp", "ix_scans_location", "ix_scan_results_scan_id")
+
+def seed(engine, rows, batch=50000):
+    start = datetime(2025, 1, 1)
+    users = ["Farmer", "Ravi", "Asha", "Meera", "Kiran"]
+    raw = '{"health_score": 80, "pest_count": 1}'
+    conn = engine.raw_connection()
+    cur = conn.cursor()
+    rng = random.Random(42)
+    for offset in range(0, rows, batch):
+        n = min(batch, rows - offset)
+        scans = [(offset + i + 1, f"temp/f{offset + i}.jpg", rng.choice(users),
+                  (start + timedelta(seconds=rng.randrange(0, 365 * 86400))).isoformat(sep=" "),
+                  20.2 + rng.random() * 0.2, 85.7 + rng.random() * 0.2) for i in range(n)]
+        cur.executemany("INSERT INTO scans (id, image_path, user_name, timestamp, location_lat, location_lon) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", scans)
+        cur.executemany("INSERT INTO scan_results (scan_id, health_score, yield_prediction, pest_detected_count, "
+                        "weather_temp, weather_humidity, weather_desc, n_level, p_level, k_level, raw_json_output) "
+                        "VALUES (?, 80.0, '4.1 Tons/Hectare', 1, 29.0, 70.0, 'Clouds', 'Optimal', 'Optimal', 'Optimal', ?)",
+                        [(s[0], raw) for s in scans])
+        conn.commit()
+    conn.close()
+
+def timed(fn, counter):
+    counter["n"] = 0
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000, counter["n"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="agriscan_bench_"), "bench.db")
+    engine = build_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    counter = {"n": 0}
+    event.listen(engine, "before_cursor_execute", lambda *a: counter.__setitem__("n", counter["n"] + 1))
+
+    t = time.perf_counter()
+    seed(engine, args.rows)
+    print(f"Seeded {args.rows} scans in {time.perf_counter() - t:.1f}s")
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    depths = [d for d in (0, 1_000, 100_000, args.rows // 2, args.rows - args.limit * 2) if d < args.rows]
+
+    # --- Baseline: pre-optimisation schema and query shape ---
+    with engine.begin() as conn:
+        for name in NEW_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    def baseline(skip):
+        scans = db.query(models.Scan).order_by(models.Scan.timestamp.desc()).offset(skip).limit(args.limit).all()
+        for s in scans:
+            _ = s.result  # lazy load per row
+        db.expire_all()
+
+    print(f"{'depth':>10}{'baseline ms':>14}{'queries':>9}{'keyset ms':>12}{'queries':>9}")
+    base = {d: timed(lambda: baseline(d), counter) for d in depths}
+
+    # --- Optimized: indexes + keyset cursor + projection ---
+    models.Base.metadata.create_all(bind=engine)  # no-op for tables
+    from migrations import run_migrations
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+
+    for d in depths:
+        cursor = None
+        if d:
+            # Cursor of the row just before the page (what a client would hold after paging there)
+            prev = db.query(models.Scan.timestamp, models.Scan.id) \
+                .order_by(models.Scan.timestamp.desc(), models.Scan.id.desc()).offset(d - 1).limit(1).one()
+            cursor = crud.encode_cursor(prev.timestamp, prev.id)
+        ms, queries = timed(lambda: crud.list_scans(db, limit=args.limit, cursor=cursor), counter)
+        print(f"{d:>10}{base[d][0]:>14.1f}{base[d][1]:>9}{ms:>12.2f}{queries:>9}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark: mixed read/write concurrency under the "default" and "production"
+SQLite storage profiles (see database.build_engine).
+
+Writer threads insert scans through crud.create_scan_entry while reader
+threads run the dashboard listing query, for a fixed duration per profile.
+Uses throwaway database files, never agriscan.db.
+
+Run from backend/:
+    python -m benchmarks.bench_sqlite_profile --writers 4 --readers 8 --seconds 10
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+from sqlalchemy.orm import sessionmaker
+
+import models, crud
+from database import build_engine
+from services.metrics import StatSummary
+from benchmarks.bench_db_writes import sample_entries
+
+def run_profile(profile, writers, readers, seconds, seed_rows):
+    path = os.path.join(tempfile.mkdtemp(prefix="agriscan_bench_"), "bench.db")
+    engine = build_engine(f"sqlite:///{path}", profile=profile)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    seed = Session()
+    crud.create_scan_entries_bulk(seed, sample_entries(seed_rows))
+    seed.close()
+
+    entries = sample_entries(1)
+    stop = time.perf_counter() + seconds
+    stats = {"write_ms": StatSummary(), "read_ms": StatSummary()}
+    errors = {"write": 0, "read": 0}
+    lock = threading.Lock()
+
+    def writer():
+        db = Session()
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                crud.create_scan_entry(db, *entries[0])
+                stats["write_ms"].observe((time.perf_counter() - start) * 1000)
+            except Exception:
+                db.rollback()
+                with lock:
+                    errors["write"] += 1
+        db.close()
+
+    def reader():
+        db = Session()
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                db.query(models.Scan).order_by(models.Scan.timestamp.desc()).limit(10).all()
+                db.rollback()  # end the read transaction like a request would
+                stats["read_ms"].observe((time.perf_counter() - start) * 1000)
+            except Exception:
+                db.rollback()
+                with lock:
+                    errors["read"] += 1
+        db.close()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)] + \
+              [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    w, r = stats["write_ms"].snapshot(), stats["read_ms"].snapshot()
+    print(f"{profile:<12}{w['count'] / seconds:>10.0f}{w['p95'] or 0:>11.1f}{errors['write']:>9}"
+          f"{r['count'] / seconds:>10.0f}{r['p95'] or 0:>11.1f}{errors['read']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--seed-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{args.writers} writers / {args.readers} readers, {args.seconds:.0f}s each, {args.seed_rows} seeded scans")
+    print(f"{'profile':<12}{'writes/s':>10}{'w p95 ms':>11}{'w errs':>9}{'reads/s':>10}{'r p95 ms':>11}{'r errs':>9}")
+    for profile in ("default", "production"):
+        run_profile(profile, args.writers, args.readers, args.seconds, args.seed_rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: concurrent large uploads, whole-body read vs streaming ingest.
+
+Variants (each runs in a fresh process so peak RSS is its own):
+  legacy     multipart, `await file.read()` then one write (the old upload path)
+  multipart  multipart, services.ingest.ingest_upload (chunked copy + sha256)
+  raw        raw image body, services.ingest.ingest_request (socket -> disk)
+
+The upload app is served in-process through httpx.ASGITransport; request
+bodies are streamed from one source file on disk, so client memory stays flat
+and the peak RSS reflects the server side. AI analysis is not included.
+
+Run from backend/:
+    python -m benchmarks.bench_upload_ingest --uploads 50 --size-mb 100
+    python -m benchmarks.bench_upload_ingest --uploads 50 --size-mb 100 --variants multipart raw
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+
+VARIANTS = ("legacy", "multipart", "raw")
+SOURCE_CHUNK = 256 * 1024
+
+def make_source(path, size_mb):
+    with open(path, "wb") as f:
+        for _ in range(size_mb * 4):
+            f.write(os.urandom(256 * 1024))
+
+def build_app(store_dir):
+    from fastapi import FastAPI, File, Request, UploadFile
+    from services.ingest import ingest_upload, ingest_request
+
+    app = FastAPI()
+
+    @app.post("/legacy")
+    async def legacy(file: UploadFile = File(...)):
+        data = await file.read()
+        with open(os.path.join(store_dir, file.filename), "wb") as f:
+            f.write(data)
+        return {"size": len(data)}
+
+    @app.post("/multipart")
+    async def multipart(file: UploadFile = File(...)):
+        return await ingest_upload(file)
+
+    @app.post("/raw")
+    async def raw(request: Request):
+        return await ingest_request(request, "upload.jpg")
+
+    return app
+
+async def run_variant(variant, source, uploads, store_dir):
+    import httpx
+
+    app = build_app(store_dir)
+    transport = httpx.ASGITransport(app=app)
+
+    async def raw_body():
+        with open(source, "rb") as f:
+            while chunk := f.read(SOURCE_CHUNK):
+                yield chunk
+
+    async def one(client, i):
+        if variant == "raw":
+            r = await client.post("/raw", content=raw_body(), headers={"content-type": "image/jpeg"})
+        else:
+            with open(source, "rb") as f:
+                r = await client.post(f"/{variant}", files={"file": (f"upload_{i}.jpg", f, "image/jpeg")})
+        r.raise_for_status()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[one(client, i) for i in range(uploads)])
+        return time.perf_counter() - start
+
+def child(args):
+    store_dir = os.environ["UPLOAD_DIR"]
+    elapsed = asyncio.run(run_variant(args.variant, args.source, args.uploads, store_dir))
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(f"{args.variant} {elapsed:.3f} {peak_mb:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=50, help="concurrent uploads")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--dir", default=None, help="scratch directory (default: system temp)")
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        return child(args)
+
+    scratch = tempfile.mkdtemp(prefix="bench_ingest_", dir=args.dir)
+    try:
+        source = os.path.join(scratch, "source.bin")
+        make_source(source, args.size_mb)
+        total_mb = args.uploads * args.size_mb
+        print(f"{args.uploads} concurrent uploads x {args.size_mb} MB ({total_mb} MB total)")
+        print(f"{'variant':<12}{'time':>9}{'MB/s':>9}{'peak RSS':>12}")
+        for variant in args.variants:
+            store_dir = os.path.join(scratch, variant)
+            os.makedirs(store_dir)
+            env = dict(os.environ, UPLOAD_DIR=store_dir, UPLOAD_MAX_MB=str(args.size_mb + 1))
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_upload_ingest", "--variant", variant,
+                 "--source", source, "--uploads", str(args.uploads)],
+                env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{variant:<12} failed (exit {out.returncode}): {out.stderr.strip().splitlines()[-1:]}")
+            else:
+                _, elapsed, peak_mb = out.stdout.split()
+                elapsed, peak_mb = float(elapsed), float(peak_mb)
+                print(f"{variant:<12}{elapsed:>8.2f}s{total_mb / elapsed:>9.0f}{peak_mb:>9.0f} MB")
+            shutil.rmtree(store_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
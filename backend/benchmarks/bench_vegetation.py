@@ -0,0 +1,71 @@
+"""
+Benchmark: VegetationIndexEngine vs the original HSV cv2.inRange health path.
+
+Run from backend/:
+    python -m benchmarks.bench_vegetation --megapixels 40
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import cv2
+
+from services.vegetation_index import VegetationIndexEngine
+
+def hsv_green_ratio(img):
+    """The original plant_health scoring path, inlined so it is measured in isolation."""
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([35, 40, 40]), np.array([85, 255, 255]))
+    green_ratio = cv2.countNonZero(mask) / (img.shape[0] * img.shape[1])
+    return min(100, int((green_ratio / 0.5) * 100))
+
+def synthetic_field(megapixels: float, seed: int = 0):
+    """Crop-like frame: green canopy with brown soil patches, 3:2 aspect like drone sensors."""
+    width = int((megapixels * 1e6 * 1.5) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[..., 0] = rng.integers(20, 80, (height, width), dtype=np.uint8)
+    img[..., 1] = rng.integers(60, 200, (height, width), dtype=np.uint8)
+    img[..., 2] = rng.integers(30, 120, (height, width), dtype=np.uint8)
+    return img
+
+def measure(fn, repeats):
+    tracemalloc.start()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, default=40.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--budget-mb", type=int, default=64)
+    parser.add_argument("--nir", action="store_true", help="Append a NIR band so NDVI is computed too")
+    args = parser.parse_args()
+
+    img = synthetic_field(args.megapixels)
+    nir = img[..., 1].copy() if args.nir else None
+    engine = VegetationIndexEngine(memory_budget_mb=args.budget_mb)
+    print(f"Frame: {img.shape[1]}x{img.shape[0]} ({img.shape[0] * img.shape[1] / 1e6:.1f} MP), "
+          f"image itself {img.nbytes / 1e6:.0f} MB")
+
+    # cv2 allocations are not visible to tracemalloc; the HSV path allocates a
+    # full-size HSV copy plus a mask, i.e. ~1.33x the frame, outside the numpy heap.
+    t_hsv, _ = measure(lambda: hsv_green_ratio(img), args.repeats)
+    t_veg, peak = measure(lambda: engine.compute(img, nir=nir), args.repeats)
+
+    mp = img.shape[0] * img.shape[1] / 1e6
+    print(f"{'path':<28}{'best s':>10}{'MP/s':>10}{'outputs':>34}")
+    print(f"{'HSV inRange (1 score)':<28}{t_hsv:>10.3f}{mp / t_hsv:>10.1f}{'green ratio':>34}")
+    outputs = f"{5 if args.nir else 4} indices x stats + tile grids"
+    print(f"{'VegetationIndexEngine':<28}{t_veg:>10.3f}{mp / t_veg:>10.1f}{outputs:>34}")
+    print(f"Engine peak working memory: {peak / 1e6:.1f} MB (budget {args.budget_mb} MB)")
+
+if __name__ == "__main__":
+    main()
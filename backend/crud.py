@@ -1,44 +1,333 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import func, insert, select, tuple_
 from sqlalchemy.orm import Session
 import models, schemas
+from services import rollups
 import json
 
 def get_scan(db: Session, scan_id: int):
     return db.query(models.Scan).filter(models.Scan.id == scan_id).first()
 
-def create_scan_entry(db: Session, scan_data: schemas.ScanCreate, result_data: schemas.ScanResultCreate):
-    # 1. Create Scan
-    db_scan = models.Scan(
-        image_path=scan_data.image_path,
-        user_name=scan_data.user_name,
-        location_lat=scan_data.location_lat,
-        location_lon=scan_data.location_lon
+def _scan_row(scan_data: schemas.ScanCreate) -> dict:
+    return {
+        "image_path": scan_data.image_path,
+        "user_name": scan_data.user_name,
+        "location_lat": scan_data.location_lat,
+        "location_lon": scan_data.location_lon,
+    }
+
+def split_detections(raw_json_output):
+    """
+    Separates pest_detections from the analysis dict (they live in the
+    scan_detections side table). Returns (raw_without_detections, detection rows).
+    Never mutates the input, which is usually also the API response.
+    """
+    if not isinstance(raw_json_output, dict) or "pest_detections" not in raw_json_output:
+        return raw_json_output, []
+    raw = dict(raw_json_output)
+    rows = []
+    for det in raw.pop("pest_detections") or []:
+        box = list(det.get("box") or [None] * 4) + [None] * 4
+        rows.append({
+            "label": det.get("label"),
+            "confidence": det.get("confidence"),
+            "box_x": box[0], "box_y": box[1], "box_w": box[2], "box_h": box[3],
+            "severity": det.get("severity"),
+        })
+    return raw, rows
+
+def _result_row(result_data: schemas.ScanResultCreate, raw_json_output=None) -> dict:
+    return {
+        "health_score": result_data.health_score,
+        "yield_prediction": result_data.yield_prediction,
+        "yield_value": result_data.yield_value,
+        "yield_unit": result_data.yield_unit,
+        "yield_trend": result_data.yield_trend,
+        "yield_confidence": result_data.yield_confidence,
+        "pest_detected_count": result_data.pest_detected_count,
+        "weather_temp": result_data.weather_temp,
+        "weather_humidity": result_data.weather_humidity,
+        "weather_desc": result_data.weather_desc,
+        "n_level": result_data.n_level,
+        "p_level": result_data.p_level,
+        "k_level": result_data.k_level,
+        "raw_json_output": raw_json_output,
+    }
+
+def _rollup_row(timestamp, scan_data: schemas.ScanCreate, result_data: schemas.ScanResultCreate):
+    return (timestamp, scan_data.user_name, scan_data.location_lat, scan_data.location_lon,
+            result_data.health_score, result_data.pest_detected_count,
+            result_data.yield_value if result_data.yield_value is not None else result_data.yield_prediction)
+
+def records_from_analysis(result: dict, image_path: str, user_name: str,
+                          lat: Optional[float] = None, lon: Optional[float] = None):
+    """Maps an AIService analysis dict onto the (ScanCreate, ScanResultCreate) pair stored for it."""
+    forecast = result.get('yield_forecast', {})
+    scan = schemas.ScanCreate(image_path=image_path, user_name=user_name, location_lat=lat, location_lon=lon)
+    scan_result = schemas.ScanResultCreate(
+        health_score=float(result.get('health_score', 0)),
+        yield_prediction=forecast.get('value', "Unknown"),
+        yield_value=forecast.get('amount'),
+        yield_unit=forecast.get('unit'),
+        yield_trend=forecast.get('trend'),
+        yield_confidence=forecast.get('confidence'),
+        pest_detected_count=int(result.get('pest_count', 0)),
+        weather_temp=result.get('weather_temp'),
+        weather_humidity=result.get('weather_humidity'),
+        weather_desc=result.get('weather_desc'),
+        n_level=result.get('n_level', "Optimal"),
+        p_level=result.get('p_level', "Optimal"),
+        k_level=result.get('k_level', "Optimal"),
+        raw_json_output=result
     )
+    return scan, scan_result
+
+def create_scan_entry(db: Session, scan_data: schemas.ScanCreate, result_data: schemas.ScanResultCreate, commit: bool = True):
+    """
+    Inserts a Scan, its ScanResult and its detections in a single transaction:
+    one flush, at most one commit, no refresh round trips. Pass commit=False
+    to fold further writes (e.g. an outbox alert) into the same transaction.
+    """
+    raw, detections = split_detections(result_data.raw_json_output)
+    db_scan = models.Scan(**_scan_row(scan_data))
+    db_scan.result = models.ScanResult(**_result_row(result_data, raw))
+    db_scan.detections = [models.ScanDetection(**d) for d in detections]
     db.add(db_scan)
-    db.commit()
-    db.refresh(db_scan)
-
-    # 2. Create Result
-    db_result = models.ScanResult(
-        scan_id=db_scan.id,
-        health_score=result_data.health_score,
-        yield_prediction=result_data.yield_prediction,
-        pest_detected_count=result_data.pest_detected_count,
-        weather_temp=result_data.weather_temp,
-        weather_humidity=result_data.weather_humidity,
-        weather_desc=result_data.weather_desc,
-        n_level=result_data.n_level,
-        p_level=result_data.p_level,
-        k_level=result_data.k_level,
-        raw_json_output=result_data.raw_json_output
-    )
-    db.add(db_result)
-    db.commit()
-    db.refresh(db_result)
-    
-    # Refresh scan to include result for return
-    db.refresh(db_scan)
+    db.flush()  # assigns primary keys for all rows
+    rollups.record_scans(db, [_rollup_row(db_scan.timestamp, scan_data, result_data)])
+
+    if commit:
+        # Keep the in-memory values valid so reading db_scan.id does not re-SELECT
+        expire, db.expire_on_commit = db.expire_on_commit, False
+        try:
+            db.commit()
+        finally:
+            db.expire_on_commit = expire
     return db_scan
 
+def create_scan_entries_bulk(db: Session, entries: List[Tuple[schemas.ScanCreate, schemas.ScanResultCreate]]) -> List[int]:
+    """
+    Persists N scans + results (+ detections) with executemany-style INSERTs
+    and one commit. Returns the new scan ids in input order.
+    """
+    if not entries:
+        return []
+    inserted = db.execute(
+        insert(models.Scan).returning(models.Scan.id, models.Scan.timestamp, sort_by_parameter_order=True),
+        [_scan_row(scan) for scan, _ in entries]
+    ).all()
+    scan_ids = [scan_id for scan_id, _ in inserted]
+
+    result_rows, detection_rows = [], []
+    for scan_id, (_, result) in zip(scan_ids, entries):
+        raw, detections = split_detections(result.raw_json_output)
+        result_rows.append({"scan_id": scan_id, **_result_row(result, raw)})
+        detection_rows.extend({"scan_id": scan_id, **d} for d in detections)
+
+    db.execute(insert(models.ScanResult), result_rows)
+    if detection_rows:
+        db.execute(insert(models.ScanDetection), detection_rows)
+    rollups.record_scans(db, [_rollup_row(ts, scan, result) for (_, ts), (scan, result) in zip(inserted, entries)])
+    db.commit()
+    return scan_ids
+
+# --- Field projection for scan reads ---
+SCAN_FIELDS = {c.key: c for c in (
+    models.Scan.id, models.Scan.image_path, models.Scan.user_name, models.Scan.timestamp,
+    models.Scan.location_lat, models.Scan.location_lon,
+)}
+RESULT_FIELDS = {c.key: c for c in (
+    models.ScanResult.health_score, models.ScanResult.yield_prediction, models.ScanResult.pest_detected_count,
+    models.ScanResult.yield_value, models.ScanResult.yield_unit, models.ScanResult.yield_trend,
+    models.ScanResult.yield_confidence,
+    models.ScanResult.weather_temp, models.ScanResult.weather_humidity, models.ScanResult.weather_desc,
+    models.ScanResult.n_level, models.ScanResult.p_level, models.ScanResult.k_level,
+    models.ScanResult.raw_json_output,
+)}
+# Loaded with one extra query, and only when asked for
+DETECTIONS_FIELD = "detections"
+
+FIELD_VIEWS = {
+    "minimal": ("id", "timestamp", "health_score", "pest_detected_count"),
+    "summary": tuple(SCAN_FIELDS) + tuple(k for k in RESULT_FIELDS if k != "raw_json_output"),
+    "full": tuple(SCAN_FIELDS) + tuple(RESULT_FIELDS) + (DETECTIONS_FIELD,),
+}
+
+def resolve_fields(fields: Optional[str] = None, view: str = "summary") -> List[str]:
+    """
+    Turns `?fields=a,b` or a named view into a validated field list.
+    Raises ValueError for unknown fields or views.
+    """
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        known = set(SCAN_FIELDS) | set(RESULT_FIELDS) | {DETECTIONS_FIELD}
+        unknown = [f for f in names if f not in known]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    elif view in FIELD_VIEWS:
+        names = list(FIELD_VIEWS[view])
+    else:
+        raise ValueError(f"Unknown view: {view}")
+    # id and timestamp are always returned (identity + pagination cursor)
+    return ["id", "timestamp"] + [f for f in names if f not in ("id", "timestamp")]
+
+def _projected_select(names: List[str]):
+    scan_cols = [SCAN_FIELDS[n] for n in names if n in SCAN_FIELDS]
+    result_cols = [RESULT_FIELDS[n] for n in names if n in RESULT_FIELDS]
+    query = select(*scan_cols, *result_cols)
+    if result_cols:
+        query = query.outerjoin(models.ScanResult, models.ScanResult.scan_id == models.Scan.id)
+    return query, [c.key for c in scan_cols], [c.key for c in result_cols]
+
+def _shape_rows(rows, scan_keys, result_keys):
+    scans = []
+    for row in rows:
+        scan = dict(zip(scan_keys, row[:len(scan_keys)]))
+        if result_keys:
+            result = dict(zip(result_keys, row[len(scan_keys):]))
+            scan["result"] = result if any(v is not None for v in result.values()) else None
+        scans.append(scan)
+    return scans
+
+def _attach_detections(db: Session, scans: List[dict]):
+    """Loads detections for a page of scans in one query, in the pest_detections format."""
+    by_scan = {scan["id"]: [] for scan in scans}
+    if by_scan:
+        rows = db.execute(
+            select(models.ScanDetection)
+            .where(models.ScanDetection.scan_id.in_(list(by_scan)))
+            .order_by(models.ScanDetection.scan_id, models.ScanDetection.id)
+        ).scalars()
+        for det in rows:
+            items = by_scan[det.scan_id]
+            items.append({
+                "id": len(items) + 1,
+                "label": det.label,
+                "confidence": det.confidence,
+                "box": [det.box_x, det.box_y, det.box_w, det.box_h],
+                "severity": det.severity,
+            })
+    for scan in scans:
+        scan[DETECTIONS_FIELD] = by_scan[scan["id"]]
+
+# --- Yield analytics (aggregated in SQL over the numeric columns) ---
+YIELD_GROUPS = {
+    "field": func.printf("%.3f:%.3f", models.Scan.location_lat, models.Scan.location_lon),
+    "day": func.date(models.Scan.timestamp),
+    "user": models.Scan.user_name,
+}
+
+def yield_summary(db: Session, group_by: str = "field", user_name: Optional[str] = None, limit: int = 100):
+    """Average/min/max yield per field, day or user. Raises ValueError for an unknown group."""
+    if group_by not in YIELD_GROUPS:
+        raise ValueError(f"Unknown group_by: {group_by}")
+    group = YIELD_GROUPS[group_by].label("group")
+    query = select(
+        group,
+        func.count(models.ScanResult.yield_value).label("scans"),
+        func.avg(models.ScanResult.yield_value).label("mean"),
+        func.min(models.ScanResult.yield_value).label("min"),
+        func.max(models.ScanResult.yield_value).label("max"),
+        func.avg(models.ScanResult.yield_confidence).label("confidence"),
+    ).join(models.ScanResult, models.ScanResult.scan_id == models.Scan.id) \
+        .where(models.ScanResult.yield_value.isnot(None))
+    if user_name:
+        query = query.where(models.Scan.user_name == user_name)
+    query = query.group_by(group).order_by(group.desc()).limit(limit)
+    return [dict(row._mapping) for row in db.execute(query)]
+
+def list_flights(db: Session, user_name: Optional[str] = None, limit: int = 20):
+    """Most recent per-flight video summaries (unique pest counts from the tracker)."""
+    query = select(*models.FlightSummary.__table__.columns)
+    if user_name:
+        query = query.where(models.FlightSummary.user_name == user_name)
+    query = query.order_by(models.FlightSummary.started_at.desc(), models.FlightSummary.id.desc()).limit(limit)
+    return [dict(row._mapping) for row in db.execute(query)]
+
+def _geotagged(query, user_name: Optional[str], since: Optional[datetime], until: Optional[datetime]):
+    query = query.where(models.Scan.location_lat.isnot(None), models.Scan.location_lon.isnot(None))
+    if user_name:
+        query = query.where(models.Scan.user_name == user_name)
+    if since:
+        query = query.where(models.Scan.timestamp >= since)
+    if until:
+        query = query.where(models.Scan.timestamp < until)
+    return query
+
+def iter_field_points(db: Session, user_name: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, batch: int = 1000):
+    """Geotagged scans with their result columns, streamed `batch` rows at a time (field maps)."""
+    query = _geotagged(select(
+        models.Scan.location_lat, models.Scan.location_lon,
+        models.ScanResult.health_score, models.ScanResult.pest_detected_count,
+        models.ScanResult.n_level, models.ScanResult.p_level, models.ScanResult.k_level,
+    ).join(models.ScanResult, models.ScanResult.scan_id == models.Scan.id), user_name, since, until)
+    yield from db.execute(query.execution_options(yield_per=batch))
+
+def iter_field_labels(db: Session, user_name: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, batch: int = 1000):
+    """(lat, lon, label) per stored detection of geotagged scans, streamed."""
+    query = _geotagged(select(
+        models.Scan.location_lat, models.Scan.location_lon, models.ScanDetection.label,
+    ).join(models.ScanDetection, models.ScanDetection.scan_id == models.Scan.id), user_name, since, until)
+    yield from db.execute(query.execution_options(yield_per=batch))
+
+def encode_cursor(timestamp: datetime, scan_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{scan_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        ts, scan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(scan_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def list_scans(db: Session, limit: int = 10, cursor: Optional[str] = None,
+               user_name: Optional[str] = None, skip: int = 0, fields: Optional[List[str]] = None):
+    """
+    Newest-first scan listing with keyset pagination on (timestamp, id).
+    Only the requested `fields` (see resolve_fields) are selected; results
+    are joined in the same query and returned as plain dicts.
+    `skip` (OFFSET) is still honoured for old clients when no cursor is given.
+
+    Returns:
+        (rows, next_cursor): next_cursor is None on the last page.
+    """
+    names = fields or resolve_fields()
+    query, scan_keys, result_keys = _projected_select(names)
+    if user_name:
+        query = query.where(models.Scan.user_name == user_name)
+    if cursor:
+        query = query.where(tuple_(models.Scan.timestamp, models.Scan.id) < decode_cursor(cursor))
+    elif skip:
+        query = query.offset(skip)
+    query = query.order_by(models.Scan.timestamp.desc(), models.Scan.id.desc()).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    scans = _shape_rows(rows[:limit], scan_keys, result_keys)
+    if DETECTIONS_FIELD in names:
+        _attach_detections(db, scans)
+
+    next_cursor = None
+    if len(rows) > limit and scans:
+        next_cursor = encode_cursor(scans[-1]["timestamp"], scans[-1]["id"])
+    return scans, next_cursor
+
+def get_scan_view(db: Session, scan_id: int, fields: Optional[List[str]] = None):
+    """Single scan with the requested fields, or None."""
+    names = fields or resolve_fields(view="full")
+    query, scan_keys, result_keys = _projected_select(names)
+    rows = db.execute(query.where(models.Scan.id == scan_id)).all()
+    if not rows:
+        return None
+    scans = _shape_rows(rows, scan_keys, result_keys)
+    if DETECTIONS_FIELD in names:
+        _attach_detections(db, scans)
+    return scans[0]
+
 def create_disease(db: Session, disease: schemas.DiseaseCreate):
     db_disease = models.DiseaseCatalog(
         disease_name=disease.disease_name,
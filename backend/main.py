@@ -1,17 +1,36 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends
+import time
+APP_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
 from services.ai_service import ai_service
+from services.inference_executor import inference_executor, ExecutorSaturated
+from services.result_cache import result_cache
+from services.ingest import ingest_upload, ingest_request, release_upload, UploadTooLarge, UploadSizeLimit, UPLOAD_MAX_MB, UPLOAD_INLINE_BYTES, PERSIST_UPLOADS
+from services.batch_upload import BatchRun, format_event, iter_images, BATCH_MAX_MB
+from services.job_queue import job_runner, submit_jobs, load_job_view, has_pending_jobs, LANES, FINAL_STATUSES
+from services.field_map import FieldMap, build_field_map, field_grid, field_maps, read_gps, DEFAULT_FIELD_LAT, DEFAULT_FIELD_LON
+from services.weather_service import weather_cache, get_real_weather
+from services import rollups
+from services.http_client import http_registry
+from services.alert_outbox import alert_dispatcher, enqueue_alert, ALERT_SMS_TO
+from services.video_pipeline import video_hub
+import asyncio
 import os
 import json
+import logging
+from datetime import datetime
+from typing import List, Optional
 
 # Database Imports
 import models, schemas, crud
 from database import SessionLocal, engine
+from migrations import run_migrations
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="AgriScan AI Backend",
@@ -35,12 +54,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 413 for oversized uploads before the multipart parser has spooled them
+app.add_middleware(UploadSizeLimit, limits={
+    "/api/v1/scan/upload": UPLOAD_MAX_MB,
+    "/api/v1/scan/batch": BATCH_MAX_MB,
+    "/api/v1/jobs": BATCH_MAX_MB,
+})
+
 os.makedirs("static/scans", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 os.makedirs("temp", exist_ok=True)
 app.mount("/temp", StaticFiles(directory="temp"), name="temp")
 
+def _init_database():
+    # Schema setup runs at startup, never at import time
+    models.Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+
+@app.on_event("startup")
+async def start_services():
+    ai_service.startup_timings["app_import_s"] = round(time.perf_counter() - APP_IMPORT_STARTED, 3)
+    await asyncio.to_thread(_init_database)
+    # Model load + warm-up runs in the background; /ready reports when it is done
+    ai_service.start()
+    await http_registry.startup()
+    await alert_dispatcher.start()
+    # Resumes jobs that were queued or running when the process last stopped
+    await job_runner.start()
+    app.state.video_reaper = asyncio.get_running_loop().create_task(video_hub.reaper())
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    await job_runner.stop()
+    await alert_dispatcher.stop()
+    app.state.video_reaper.cancel()
+    video_hub.shutdown()
+    await http_registry.shutdown()
+    inference_executor.shutdown()
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -51,57 +103,62 @@ def get_db():
 
 @app.get("/")
 async def root():
+    # Liveness: answers as soon as the process serves HTTP, model or not
     return {"message": "AgriScan AI API is running with SQLite Database!"}
 
-@app.post("/api/v1/scan/upload")
-async def upload_scan(
-    file: UploadFile = File(...), 
-    user_name: str = Query("Farmer", description="Name of the user"),
-    lang: str = Query("en", description="Language for action plan"),
-    db: Session = Depends(get_db)
-):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
-    os.makedirs("temp", exist_ok=True)
-    
-    try:
-        file_location = f"temp/{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            file_object.write(await file.read())
-            
-        # 1. Run AI Analysis
-        result = await ai_service.analyze_image(file_location, user_name=user_name)
-        
-        # 2. Save to Database
-        scan_create = schemas.ScanCreate(
-            image_path=file_location,
-            user_name=user_name,
-            location_lat=20.296,
-            location_lon=85.824
-        )
-        
-        result_create = schemas.ScanResultCreate(
-            health_score=float(result.get('health_score', 0)),
-            yield_prediction=result.get('yield_forecast', {}).get('value', "Unknown"),
-            pest_detected_count=int(result.get('pest_count', 0)),
-            weather_temp=result.get('weather_temp'),
-            weather_humidity=result.get('weather_humidity'),
-            weather_desc=result.get('weather_desc'),
-            n_level=result.get('n_level', "Optimal"),
-            p_level=result.get('p_level', "Optimal"),
-            k_level=result.get('k_level', "Optimal"),
-            raw_json_output=result
+@app.get("/ready")
+async def ready(response: Response):
+    # Readiness: 503 until the model has loaded and warmed up (or Mock Mode was chosen)
+    status = ai_service.readiness()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
+async def _release_stored_upload(stored: dict):
+    # With PERSIST_UPLOADS=0 the file goes once no other in-flight request or queued job needs the same content
+    discard = not PERSIST_UPLOADS and not await asyncio.to_thread(has_pending_jobs, stored["path"])
+    release_upload(stored["path"], discard=discard)
+
+def _store_scan(db: Session, result: dict, image_path: str, user_name: str, lat: float, lon: float):
+    """Stores the scan and queues its SMS alert (the outbox worker delivers it); returns (scan id, alert queued)."""
+    scan_create, result_create = crud.records_from_analysis(result, image_path, user_name, lat, lon)
+    db_scan = crud.create_scan_entry(db, scan_create, result_create, commit=False)
+    pest_count = int(result.get('pest_count', 0))
+    alert = None
+    if ALERT_SMS_TO and pest_count > 0:
+        alert = enqueue_alert(
+            db, ALERT_SMS_TO,
+            f"AgriScan alert: {pest_count} pests detected in {user_name}'s field. Apply pesticide.",
+            dedup_key=f"field:{scan_create.location_lat:.3f}:{scan_create.location_lon:.3f}",
+            commit=False
         )
+    scan_id = db_scan.id
+    db.commit()
+    return scan_id, alert is not None
+
+async def _analyze_stored_upload(stored: dict, user_name: str, lang: str, db: Session):
+    try:
+        # 1. Locate the image in the field (GPS EXIF, else the field origin): weather and zone depend on it
+        image = stored.get("data") or stored["path"]
+        gps = await asyncio.to_thread(read_gps, image)
+        lat, lon = gps or (DEFAULT_FIELD_LAT, DEFAULT_FIELD_LON)
+        zone = field_grid.zone_of(lat, lon)
+
+        # 2. Run AI Analysis (decoded from the uploaded bytes when kept in memory; re-uploads hit the result cache)
+        result = await ai_service.analyze_image(image, user_name=user_name, content_hash=stored["sha256"],
+                                                lat=lat, lon=lon)
         
-        db_scan = crud.create_scan_entry(db, scan_create, result_create)
+        # 3. Save to Database, queueing the SMS alert in the same transaction (off the event loop)
+        scan_id, alert_queued = await asyncio.to_thread(_store_scan, db, result, stored["path"], user_name, lat, lon)
+        if alert_queued:
+            alert_dispatcher.wake()
         
-        # 3. Translation Logic for Response
+        # 4. Translation Logic for Response
         if lang == 'hi':
             translated_actions = []
             for action in result.get('action_plan', []):
                 if "Nitrogen" in action:
-                    translated_actions.append("ज़ोन ए में नाइट्रोजन उर्वरक डालें")
+                    translated_actions.append(f"ज़ोन {zone} में नाइट्रोजन उर्वरक डालें")
                 elif "Pest" in action:
                     translated_actions.append("कीटों का पता चला: तुरंत कीटनाशक का छिड़काव करें")
                 elif "Irrigation" in action:
@@ -110,23 +167,271 @@ async def upload_scan(
                     translated_actions.append(action)
             result['action_plan'] = translated_actions
             
-        # Add DB ID to response for tracking
-        result['db_id'] = db_scan.id
+        # Add DB ID, stored-file info and field location to response for tracking
+        result['db_id'] = scan_id
+        result['upload'] = {k: stored[k] for k in ("sha256", "size", "duplicate")}
+        result['location'] = {"lat": lat, "lon": lon, "zone": zone, "source": "exif" if gps else "default"}
             
         return result
+    except ExecutorSaturated as e:
+        # Backpressure: tell the client to retry instead of piling up work
+        raise HTTPException(status_code=503, detail=f"Inference busy: {e}", headers={"Retry-After": "2"})
     except Exception as e:
-        print(f"Error processing image: {e}")
+        logger.exception(f"Error processing image: {e}")
         raise HTTPException(status_code=500, detail="AI Processing Failed")
+    finally:
+        await _release_stored_upload(stored)
+
+@app.post("/api/v1/scan/upload")
+async def upload_scan(
+    file: UploadFile = File(...), 
+    user_name: str = Query("Farmer", description="Name of the user"),
+    lang: str = Query("en", description="Language for action plan"),
+    db: Session = Depends(get_db)
+):
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    try:
+        stored = await ingest_upload(file, keep_bytes=UPLOAD_INLINE_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await _analyze_stored_upload(stored, user_name, lang, db)
+
+@app.post("/api/v1/scan/upload/stream")
+async def upload_scan_stream(
+    request: Request,
+    filename: str = Query("upload.jpg", description="Original file name (only its extension is kept)"),
+    user_name: str = Query("Farmer", description="Name of the user"),
+    lang: str = Query("en", description="Language for action plan"),
+    db: Session = Depends(get_db)
+):
+    # Raw image body instead of multipart: copied from the socket to storage chunk by chunk
+    if not request.headers.get("content-type", "").startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    try:
+        stored = await ingest_request(request, filename, keep_bytes=UPLOAD_INLINE_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await _analyze_stored_upload(stored, user_name, lang, db)
+
+@app.post("/api/v1/scan/batch")
+async def upload_scan_batch(
+    request: Request,
+    files: List[UploadFile] = File(..., description="Images and/or zip / tar archives of images"),
+    user_name: str = Query("Farmer", description="Name of the user"),
+    format: Optional[str] = Query(None, description="ndjson or sse (default: from the Accept header)")
+):
+    # One request per flight: results stream back as images finish, progress after every DB flush
+    fmt = format or ("sse" if "text/event-stream" in request.headers.get("accept", "") else "ndjson")
+    if fmt not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or sse")
+    run = BatchRun(files, user_name, DEFAULT_FIELD_LAT, DEFAULT_FIELD_LON)
+
+    async def body():
+        async for event in run.events():
+            yield format_event(event, fmt)
+
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_scan_jobs(
+    files: List[UploadFile] = File(..., description="One image, several images, or zip / tar archives"),
+    user_name: str = Query("Farmer", description="Name of the user"),
+    lane: Optional[str] = Query(None, description="interactive or bulk (default: interactive for one image)"),
+    db: Session = Depends(get_db)
+):
+    # Returns at once; analysis runs on the job workers and survives restarts
+    if lane is not None and lane not in LANES:
+        raise HTTPException(status_code=400, detail=f"lane must be one of {', '.join(LANES)}")
+    accepted, errors = [], []
+    async for filename, stored, error in iter_images(files):
+        if error:
+            errors.append({"filename": filename, "detail": error})
+        else:
+            accepted.append((filename, stored))
+    if not accepted:
+        raise HTTPException(status_code=400, detail={"message": "No images to analyse", "errors": errors})
+    lane = lane or ("interactive" if len(accepted) == 1 else "bulk")
+    try:
+        for _, stored in accepted:
+            stored["gps"] = await asyncio.to_thread(read_gps, stored["path"])
+        job_ids = await asyncio.to_thread(submit_jobs, db, [stored for _, stored in accepted], user_name, lane,
+                                          DEFAULT_FIELD_LAT, DEFAULT_FIELD_LON)
+    finally:
+        # The queued jobs now reference the files, so a concurrent upload's discard must not remove them
+        for _, stored in accepted:
+            release_upload(stored["path"], keep=True)
+    return {
+        "lane": lane,
+        "jobs": [{"job_id": job_id, "filename": filename, "status_url": f"/api/v1/jobs/{job_id}",
+                  "events_url": f"/api/v1/jobs/{job_id}/events"}
+                 for job_id, (filename, _) in zip(job_ids, accepted)],
+        "errors": errors,
+    }
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: int):
+    job = await asyncio.to_thread(load_job_view, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events(job_id: int):
+    # SSE: one event per status change, ending with the done / failed state (result included)
+    changed = job_runner.subscribe(job_id)  # before the first read, so no change is missed
+    job = await asyncio.to_thread(load_job_view, job_id)
+    if job is None:
+        job_runner.unsubscribe(job_id, changed)
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream(job):
+        last = None
+        try:
+            while True:
+                if job["status"] != last:
+                    last = job["status"]
+                    yield f"event: {last}\ndata: {json.dumps(job, default=str)}\n\n"
+                if last in FINAL_STATUSES:
+                    break
+                try:
+                    await asyncio.wait_for(changed.wait(), 15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                changed.clear()
+                job = await asyncio.to_thread(load_job_view, job_id)
+        finally:
+            job_runner.unsubscribe(job_id, changed)
+
+    return StreamingResponse(stream(job), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/api/v1/scans")
-async def get_scans(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    scans = db.query(models.Scan).order_by(models.Scan.timestamp.desc()).offset(skip).limit(limit).all()
-    # Ensure nested relationships are loaded if needed, but Pydantic orm_mode handles lazy access mostly.
+async def get_scans(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+    user_name: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields, e.g. health_score,detections"),
+    view: str = Query("summary", description="Named field set: minimal, summary or full"),
+    db: Session = Depends(get_db)
+):
+    try:
+        selected = crud.resolve_fields(fields, view)
+        scans, next_cursor = crud.list_scans(db, limit=limit, cursor=cursor, user_name=user_name,
+                                             skip=skip, fields=selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return scans
 
+@app.get("/api/v1/scans/{scan_id}")
+async def get_scan_detail(
+    scan_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields; defaults to the full view"),
+    view: str = Query("full", description="Named field set: minimal, summary or full"),
+    db: Session = Depends(get_db)
+):
+    try:
+        selected = crud.resolve_fields(fields, view)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    scan = crud.get_scan_view(db, scan_id, fields=selected)
+    if scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return scan
+
 @app.get("/api/v1/dashboard/stats")
-async def get_dashboard_stats():
-    return ai_service.get_dashboard_stats()
+async def get_dashboard_stats(
+    user_name: Optional[str] = Query(None, description="Limit the totals to one user"),
+    db: Session = Depends(get_db)
+):
+    # Totals come from the materialized rollups (O(1) in the number of scans)
+    stats = await asyncio.to_thread(rollups.dashboard_stats, db, user_name)
+    weather = await get_real_weather(DEFAULT_FIELD_LAT, DEFAULT_FIELD_LON)
+    stats["weather"] = {
+        "temp": weather.get("temp"),
+        "humidity": weather.get("humidity"),
+        "condition": weather.get("condition")
+    }
+    return stats
+
+@app.get("/api/v1/analytics/yield")
+async def get_yield_analytics(
+    group_by: str = Query("field", description="field, day or user"),
+    user_name: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    try:
+        return crud.yield_summary(db, group_by=group_by, user_name=user_name, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/v1/flights")
+async def get_flights(
+    user_name: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    # One row per pass over a video source: unique pests counted once via tracking
+    return crud.list_flights(db, user_name=user_name, limit=limit)
+
+@app.get("/api/v1/fields/map")
+async def get_field_map(
+    user_name: Optional[str] = None,
+    since: Optional[datetime] = Query(None, description="Only scans taken at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only scans taken before this time"),
+    metric: Optional[str] = Query(None, description=f"Also return a raster of one of: {', '.join(FieldMap.METRICS)}"),
+):
+    # Per-zone NPK / pest / health summary of stored geotagged scans, aggregated row by row
+    if metric is not None and metric not in FieldMap.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(FieldMap.METRICS)}")
+
+    def build():
+        db = SessionLocal()
+        try:
+            return build_field_map(db, user_name, since, until)
+        finally:
+            db.close()
+
+    field_map = await asyncio.to_thread(build)
+    response = field_map.summary()
+    if metric:
+        response["raster"] = field_map.raster(metric)
+    return response
+
+@app.get("/api/v1/fields/maps/{map_id}")
+async def get_flight_map(map_id: str, metric: Optional[str] = Query(None, description="Also return a raster")):
+    # Live map of a batch upload (map_id from its progress events); updated as results are stored
+    field_map = field_maps.get(map_id)
+    if field_map is None:
+        raise HTTPException(status_code=404, detail="Field map not found")
+    if metric is not None and metric not in FieldMap.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(FieldMap.METRICS)}")
+    response = field_map.summary()
+    if metric:
+        response["raster"] = field_map.raster(metric)
+    return response
+
+@app.get("/api/v1/metrics")
+async def get_metrics():
+    # Outbox depth and job lanes are DB queries; keep them off the event loop
+    alerts, jobs = await asyncio.gather(asyncio.to_thread(alert_dispatcher.stats), asyncio.to_thread(job_runner.stats))
+    return {
+        "inference": ai_service.batcher.metrics_snapshot(),
+        "tiling": ai_service.tiling_snapshot(),
+        "executor": inference_executor.stats(),
+        "weather_cache": weather_cache.stats(),
+        "http": http_registry.stats(),
+        "alerts": alerts,
+        "video": video_hub.stats(),
+        "result_cache": result_cache.stats(),
+        "jobs": jobs,
+        "startup": ai_service.readiness()
+    }
 
 @app.get("/api/v1/map/layers/{scan_id}")
 async def get_map_layers(scan_id: str):
@@ -137,9 +442,7 @@ async def get_map_layers(scan_id: str):
     }
 
 @app.get("/video_feed")
-async def video_feed(file_path: str = None):
-    from fastapi.responses import StreamingResponse
-    
+async def video_feed(file_path: str = None, user_name: Optional[str] = Query(None, description="Owner of the flight summary")):
     # Default simulation video if none provided
     # In a real scenario, this would come from the database or an upload
     if not file_path:
@@ -149,7 +452,7 @@ async def video_feed(file_path: str = None):
              return JSONResponse(status_code=404, content={"message": "No video source available for simulation."})
 
     return StreamingResponse(
-        ai_service.generate_video_stream(file_path), 
+        ai_service.generate_video_stream(file_path, user_name=user_name), 
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
 
@@ -0,0 +1,125 @@
+import logging
+from sqlalchemy import inspect, func, text
+from sqlalchemy.orm import Session
+
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+def _add_missing_columns(engine):
+    """create_all() never alters existing tables; add new nullable columns in place."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                logger.info(f"Migration: adding column {table.name}.{column.name}")
+                col_type = column.type.compile(dialect=engine.dialect)
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+def _dedupe_pending_alerts(engine):
+    """Queued alerts sharing a dedup key (from before the unique index) keep only the oldest."""
+    if not inspect(engine).has_table("alert_outbox"):
+        return
+    with engine.begin() as conn:
+        dropped = conn.execute(text("""
+            UPDATE alert_outbox SET status = 'failed', last_error = 'duplicate of an earlier queued alert'
+            WHERE dedup_key IS NOT NULL AND status IN ('pending', 'sending')
+              AND id NOT IN (
+                  SELECT min(id) FROM alert_outbox
+                  WHERE dedup_key IS NOT NULL AND status IN ('pending', 'sending')
+                  GROUP BY dedup_key
+              )
+        """)).rowcount
+    if dropped:
+        logger.info(f"Migration: dropped {dropped} duplicate queued alerts")
+
+def _create_missing_indexes(engine):
+    """create_all() skips indexes on tables that already exist; add any that are missing."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Migration: creating index {index.name}")
+                index.create(bind=engine)
+
+def _move_detections_to_side_table(engine, chunk=500):
+    """Older rows kept pest_detections inside raw_json_output; move them to scan_detections."""
+    if engine.dialect.name != "sqlite":
+        return
+    import models, crud
+    has_detections = func.json_extract(models.ScanResult.raw_json_output, "$.pest_detections").isnot(None)
+    with Session(engine) as db:
+        moved = 0
+        while True:
+            rows = db.query(models.ScanResult).filter(has_detections).limit(chunk).all()
+            if not rows:
+                break
+            for row in rows:
+                raw, detections = crud.split_detections(row.raw_json_output)
+                row.raw_json_output = raw
+                db.add_all(models.ScanDetection(scan_id=row.scan_id, **d) for d in detections)
+            db.commit()
+            moved += len(rows)
+        if moved:
+            logger.info(f"Migration: moved detections of {moved} scans to scan_detections")
+
+def _backfill_yield_columns(engine, chunk=50000):
+    """
+    Parses legacy "4.2 Tons/Hectare" strings into yield_value/yield_unit and takes
+    trend/confidence from the stored forecast. Runs in SQL, in id ranges.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect() as conn:
+        pending = conn.execute(text(
+            "SELECT min(id), max(id) FROM scan_results "
+            "WHERE yield_value IS NULL AND yield_prediction GLOB '[0-9]*'"
+        )).one()
+    if pending[0] is None:
+        return
+    low, high = pending
+    for start in range(low, high + 1, chunk):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE scan_results SET
+                    yield_value = CAST(yield_prediction AS REAL),
+                    yield_unit = nullif(trim(substr(yield_prediction, instr(yield_prediction, ' ') + 1)), ''),
+                    yield_trend = coalesce(yield_trend, json_extract(raw_json_output, '$.yield_forecast.trend')),
+                    yield_confidence = coalesce(yield_confidence,
+                                                json_extract(raw_json_output, '$.yield_forecast.confidence'))
+                WHERE id BETWEEN :start AND :end
+                  AND yield_value IS NULL AND yield_prediction GLOB '[0-9]*'
+            """), {"start": start, "end": start + chunk - 1})
+    logger.info(f"Migration: backfilled numeric yield columns for scan_results {low}..{high}")
+
+def _backfill_rollups(engine):
+    """Databases from before scan_rollups existed get their rollups built once from history."""
+    import models
+    from services import rollups
+    with Session(engine) as db:
+        if db.query(models.ScanRollup.scope).first() is None and db.query(models.Scan.id).first() is not None:
+            rollups.rebuild(db)
+
+MIGRATIONS = [
+    _add_missing_columns,
+    _dedupe_pending_alerts,
+    _create_missing_indexes,
+    _move_detections_to_side_table,
+    _backfill_yield_columns,
+    _backfill_rollups,
+]
+
+def run_migrations(engine):
+    """
+    Idempotent schema upgrades for databases created by older versions.
+    Run after Base.metadata.create_all(); each step checks before changing anything.
+    """
+    for step in MIGRATIONS:
+        step(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, JSON, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -15,15 +15,27 @@ class Scan(Base):
 
     # Relationships
     result = relationship("ScanResult", back_populates="scan", uselist=False)
+    detections = relationship("ScanDetection", back_populates="scan")
+
+    __table_args__ = (
+        # Newest-first listing + keyset cursor (timestamp, id)
+        Index("ix_scans_timestamp_id", "timestamp", "id"),
+        Index("ix_scans_user_timestamp", "user_name", "timestamp"),
+        Index("ix_scans_location", "location_lat", "location_lon"),
+    )
 
 class ScanResult(Base):
     __tablename__ = "scan_results"
 
     id = Column(Integer, primary_key=True, index=True)
-    scan_id = Column(Integer, ForeignKey("scans.id"))
+    scan_id = Column(Integer, ForeignKey("scans.id"), index=True)
     
     health_score = Column(Float)
-    yield_prediction = Column(String) 
+    yield_prediction = Column(String) # display string, kept for the frontend
+    yield_value = Column(Float, nullable=True)
+    yield_unit = Column(String, nullable=True)
+    yield_trend = Column(String, nullable=True)
+    yield_confidence = Column(Float, nullable=True)
     pest_detected_count = Column(Integer)
     
     # Weather Context
@@ -36,11 +48,47 @@ class ScanResult(Base):
     p_level = Column(String, default="Optimal")
     k_level = Column(String, default="Optimal")
     
-    raw_json_output = Column(JSON)
+    raw_json_output = Column(JSON) # analysis dict minus pest_detections (see ScanDetection)
 
     # Relationships
     scan = relationship("Scan", back_populates="result")
 
+class ScanDetection(Base):
+    """One detected pest box; kept out of raw_json_output so lists stay small."""
+    __tablename__ = "scan_detections"
+
+    id = Column(Integer, primary_key=True)
+    scan_id = Column(Integer, ForeignKey("scans.id"), index=True, nullable=False)
+    label = Column(String)
+    confidence = Column(Float)
+    # Normalized box (percent of image): centre x, centre y, width, height
+    box_x = Column(Float)
+    box_y = Column(Float)
+    box_w = Column(Float)
+    box_h = Column(Float)
+    severity = Column(String)
+
+    scan = relationship("Scan", back_populates="detections")
+
+class ScanRollup(Base):
+    """Running scan aggregates, updated with every insert (see services.rollups)."""
+    __tablename__ = "scan_rollups"
+
+    scope = Column(String, primary_key=True) # all / user / day / user_day / field
+    key = Column(String, primary_key=True)   # e.g. "2026-01-30", "Farmer|2026-01-30", "20.296:85.824"
+    scan_count = Column(Integer, default=0)
+    health_count = Column(Integer, default=0)
+    health_sum = Column(Float, default=0.0)
+    health_min = Column(Float, nullable=True)
+    health_max = Column(Float, nullable=True)
+    pest_total = Column(Integer, default=0)
+    alert_count = Column(Integer, default=0)
+    yield_count = Column(Integer, default=0)
+    yield_sum = Column(Float, default=0.0)
+    yield_min = Column(Float, nullable=True)
+    yield_max = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class DiseaseCatalog(Base):
     __tablename__ = "disease_catalog"
 
@@ -48,3 +96,84 @@ class DiseaseCatalog(Base):
     disease_name = Column(String, unique=True, index=True)
     recommended_cure = Column(Text)
     severity_level = Column(String, default="Medium")
+
+class WeatherCacheEntry(Base):
+    __tablename__ = "weather_cache"
+
+    cell_key = Column(String, primary_key=True) # "<lat row>:<lon col>" grid cell
+    fetched_at = Column(Float, nullable=False)  # Unix time of the upstream fetch
+    payload = Column(JSON)
+
+class AlertOutbox(Base):
+    __tablename__ = "alert_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, default="sms")
+    to_number = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    dedup_key = Column(String, nullable=True, index=True) # e.g. "field:20.296:85.824"
+    status = Column(String, default="pending") # pending / sending / sent / failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_alert_outbox_status_due", "status", "next_attempt_at"),
+        # At most one queued alert per dedup key, even when two scans enqueue at once
+        Index("ux_alert_outbox_dedup_pending", "dedup_key", unique=True,
+              sqlite_where=text("dedup_key IS NOT NULL AND status IN ('pending', 'sending')")),
+    )
+
+class FlightSummary(Base):
+    __tablename__ = "flight_summaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False) # video file or stream URL
+    user_name = Column(String, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    ended_at = Column(DateTime, default=datetime.utcnow)
+    frames_analysed = Column(Integer, default=0)
+    keyframes = Column(Integer, default=0) # frames that went through the detector
+    unique_pests = Column(Integer, default=0) # confirmed tracks, each pest counted once
+    peak_visible = Column(Integer, default=0)
+    max_confidence = Column(Float, nullable=True)
+    mean_track_s = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index("ix_flight_summaries_user_started", "user_name", "started_at"),
+    )
+
+class AnalysisCacheEntry(Base):
+    __tablename__ = "analysis_cache"
+
+    content_hash = Column(String, primary_key=True)  # sha256 of the uploaded file
+    model_version = Column(String, primary_key=True) # "<backend>:<weights sha256 prefix>"
+    rules_version = Column(String, primary_key=True) # fingerprint of scoring rules + thresholds
+    result = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    lane = Column(String, default="interactive") # interactive / bulk
+    priority = Column(Integer, default=0)        # lower is claimed first (derived from lane)
+    status = Column(String, default="queued")    # queued / running / done / failed
+    image_path = Column(String, nullable=False)
+    content_hash = Column(String, nullable=True)
+    user_name = Column(String, nullable=True)
+    location_lat = Column(Float, nullable=True)
+    location_lon = Column(Float, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    scan_id = Column(Integer, ForeignKey("scans.id"), nullable=True)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_claim", "status", "priority", "id"),
+    )
@@ -0,0 +1,198 @@
+"""
+Re-scores stored scans after health thresholds, NPK rules or yield
+coefficients change, without re-uploading anything.
+
+Streams scans in id order, decodes the stored images in a process pool,
+recomputes health -> NPK -> yield -> action plan and writes each chunk back with one bulk
+UPDATE. Progress is checkpointed after every chunk, so an interrupted run
+resumes where it stopped. Pest counts are kept as stored (re-detecting
+needs the model; use the API for that).
+
+Run from backend/:
+    python rescore.py --chunk 500 --workers 4
+    python rescore.py --reset            # start over from the first scan
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import bindparam, func, select, update
+
+import models
+from database import SessionLocal, engine
+from services import rollups
+from services.scoring import npk_levels, sanitize_health, action_plan, scan_alerts
+from services.farmvibes_yield import farmvibes_engine, yield_forecast
+from services.field_map import field_grid
+
+logger = logging.getLogger("rescore")
+
+DEFAULT_CHECKPOINT = "rescore.checkpoint.json"
+
+def _init_worker():
+    from services.inference_executor import configure_native_threads
+    configure_native_threads(1)  # one image per process; no nested OpenCV threads
+
+def score_image(path: str, method: str = None):
+    """Health score for one stored image, or None when it cannot be read (worker side)."""
+    from services.image_io import load_image
+    from services.plant_health import calculate_health_index
+    if not path or not os.path.exists(path):
+        return None
+    img = load_image(path)
+    if img is None:
+        return None
+    return float(sanitize_health(calculate_health_index(img, method)))
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_id": 0, "rescored": 0, "missing_images": 0}
+
+def save_checkpoint(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)  # atomic: a crash never leaves a half-written checkpoint
+
+def fetch_chunk(db, last_id, size):
+    query = select(
+        models.Scan.id, models.Scan.image_path, models.Scan.user_name, models.ScanResult.id,
+        models.Scan.location_lat, models.Scan.location_lon,
+        models.ScanResult.health_score, models.ScanResult.pest_detected_count,
+        models.ScanResult.weather_temp, models.ScanResult.weather_humidity, models.ScanResult.weather_desc,
+    ).join(models.ScanResult, models.ScanResult.scan_id == models.Scan.id) \
+        .where(models.Scan.id > last_id).order_by(models.Scan.id).limit(size)
+    return db.execute(query).all()
+
+def rescore_rows(rows, healths):
+    """Applies the current rules to a chunk. Returns bulk-update parameter dicts."""
+    params = []
+    levels = []
+    for row, health in zip(rows, healths):
+        health = row.health_score if health is None else health
+        levels.append(npk_levels(health, row.pest_detected_count or 0, row.weather_desc, row.weather_humidity))
+        params.append({"id": row[3], "health_score": health})
+
+    yields = farmvibes_engine.predict_yield_batch(
+        [p["health_score"] for p in params],
+        [row.pest_detected_count or 0 for row in rows],
+        [row.weather_temp if row.weather_temp is not None else float("nan") for row in rows],
+        [row.weather_humidity if row.weather_humidity is not None else float("nan") for row in rows],
+        [n for n, _, _ in levels],
+        [k for _, _, k in levels],
+    )
+    for i, p in enumerate(params):
+        amount = float(yields["amount"][i])
+        forecast = yield_forecast(None if amount != amount else amount, str(yields["trend"][i]),
+                                  None if amount != amount else float(yields["confidence"][i]))
+        n, ph, k = levels[i]
+        row = rows[i]
+        pests = row.pest_detected_count or 0
+        zone = field_grid.zone_of(row.location_lat, row.location_lon) if row.location_lat is not None else None
+        p.update(n_level=n, p_level=ph, k_level=k,
+                 action_plan=json.dumps(action_plan(row.user_name or "Farmer", n, ph, k, pests, zone)),
+                 alerts=json.dumps(scan_alerts(pests)),
+                 yield_prediction=forecast["value"], yield_value=forecast["amount"],
+                 yield_unit=forecast["unit"], yield_trend=forecast["trend"],
+                 yield_confidence=forecast["confidence"])
+    return params
+
+UPDATED_COLUMNS = ("health_score", "n_level", "p_level", "k_level", "yield_prediction",
+                   "yield_value", "yield_unit", "yield_trend", "yield_confidence")
+# JSON paths in raw_json_output kept in sync with the columns above
+JSON_PATHS = {
+    "health_score": "$.health_score", "n_level": "$.n_level", "p_level": "$.p_level", "k_level": "$.k_level",
+    "yield_prediction": "$.yield_forecast.value", "yield_value": "$.yield_forecast.amount",
+    "yield_unit": "$.yield_forecast.unit", "yield_trend": "$.yield_forecast.trend",
+    "yield_confidence": "$.yield_forecast.confidence",
+}
+# Report fields regenerated from the new levels; stored only in raw_json_output (bound as JSON text)
+JSON_ONLY_PATHS = {"action_plan": "$.action_plan", "alerts": "$.alerts"}
+
+def _update_statement():
+    """One executemany UPDATE by primary key (bind names are prefixed; SQLAlchemy reserves column names)."""
+    t = models.ScanResult.__table__
+    json_args = []
+    for col, path in JSON_PATHS.items():
+        json_args += [path, bindparam(f"b_{col}")]
+    for key, path in JSON_ONLY_PATHS.items():
+        json_args += [path, func.json(bindparam(f"b_{key}"))]
+    values = {col: bindparam(f"b_{col}") for col in UPDATED_COLUMNS}
+    values["raw_json_output"] = func.json_set(t.c.raw_json_output, *json_args)
+    return update(t).where(t.c.id == bindparam("b_id")).values(**values)
+
+def _bind(params):
+    return [{f"b_{k}": v for k, v in p.items()} for p in params]
+
+def run(chunk: int, workers: int, checkpoint_path: str, method: str = None, limit: int = None):
+    state = load_checkpoint(checkpoint_path)
+    if state["last_id"]:
+        logger.info(f"Resuming after scan id {state['last_id']} ({state['rescored']} already rescored)")
+
+    stmt = _update_statement()
+    db = SessionLocal()
+    started, done = time.perf_counter(), 0
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        try:
+            while limit is None or done < limit:
+                rows = fetch_chunk(db, state["last_id"], chunk if limit is None else min(chunk, limit - done))
+                if not rows:
+                    break
+                paths = [row.image_path for row in rows]
+                healths = list(pool.map(score_image, paths, [method] * len(paths),
+                                        chunksize=max(1, len(paths) // (workers * 4))))
+
+                db.execute(stmt, _bind(rescore_rows(rows, healths)))
+                db.commit()
+
+                done += len(rows)
+                state["last_id"] = rows[-1][0]
+                state["rescored"] += len(rows)
+                state["missing_images"] += sum(h is None for h in healths)
+                save_checkpoint(checkpoint_path, state)
+
+                elapsed = time.perf_counter() - started
+                logger.info(f"Rescored {state['rescored']} scans (last id {state['last_id']}), "
+                            f"{done / elapsed:.0f} scans/s, {state['missing_images']} missing images")
+        finally:
+            db.close()
+
+    if limit is None or done < limit:
+        # Finished the whole table: derived aggregates now reflect the new scores
+        db = SessionLocal()
+        try:
+            rollups.rebuild(db)
+        finally:
+            db.close()
+        state["completed"] = True
+        save_checkpoint(checkpoint_path, state)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Done: {done} scans in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f} scans/s)")
+    return state
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk", type=int, default=500, help="scans per read / bulk update")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="image decoding processes")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--method", choices=("hsv", "vegetation"), default=None,
+                        help="health scoring method (default: HEALTH_INDEX_METHOD)")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many scans")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and start from the first scan")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.reset and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    models.Base.metadata.create_all(bind=engine)
+    run(args.chunk, args.workers, args.checkpoint, args.method, args.limit)
+
+if __name__ == "__main__":
+    main()
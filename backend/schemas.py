@@ -19,7 +19,11 @@ class Disease(DiseaseBase):
 # --- Scan Result Schemas ---
 class ScanResultBase(BaseModel):
     health_score: float
-    yield_prediction: str
+    yield_prediction: str # display string, e.g. "4.2 Tons/Hectare"
+    yield_value: Optional[float] = None
+    yield_unit: Optional[str] = None
+    yield_trend: Optional[str] = None
+    yield_confidence: Optional[float] = None
     pest_detected_count: int
     weather_temp: Optional[float] = None
     weather_humidity: Optional[float] = None
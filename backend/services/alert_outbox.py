@@ -0,0 +1,238 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+from database import SessionLocal
+from services.external_api import send_sms_alert
+
+logger = logging.getLogger(__name__)
+
+# "twilio" (falls back to a log line when keys are missing) or "fake" for tests / load runs
+ALERT_PROVIDER = os.getenv("ALERT_PROVIDER", "twilio").lower()
+ALERT_SMS_TO = os.getenv("ALERT_SMS_TO")
+ALERT_RATE_PER_SEC = float(os.getenv("ALERT_RATE_PER_SEC", "5"))
+ALERT_CONCURRENCY = int(os.getenv("ALERT_CONCURRENCY", "4"))
+ALERT_BATCH_SIZE = int(os.getenv("ALERT_BATCH_SIZE", "20"))
+ALERT_MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "5"))
+ALERT_BACKOFF_BASE = float(os.getenv("ALERT_BACKOFF_BASE", "2.0"))
+ALERT_POLL_INTERVAL = float(os.getenv("ALERT_POLL_INTERVAL", "5.0"))
+# Repeated alerts for the same field inside this window are dropped
+ALERT_DEDUP_WINDOW = float(os.getenv("ALERT_DEDUP_WINDOW", "3600"))
+
+class TwilioProvider:
+    name = "twilio"
+
+    async def send(self, to_number: str, body: str) -> bool:
+        return await send_sms_alert(to_number, body)
+
+class FakeProvider:
+    """In-memory provider with configurable latency and failure rate."""
+    name = "fake"
+
+    def __init__(self, latency_ms=None, failure_rate=None):
+        self.latency = float(latency_ms if latency_ms is not None else os.getenv("ALERT_FAKE_LATENCY_MS", "50")) / 1000
+        self.failure_rate = float(failure_rate if failure_rate is not None else os.getenv("ALERT_FAKE_FAILURE_RATE", "0"))
+        self.sent = []
+
+    async def send(self, to_number: str, body: str) -> bool:
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            return False
+        self.sent.append((to_number, body))
+        return True
+
+def build_provider(name=ALERT_PROVIDER):
+    return FakeProvider() if name == "fake" else TwilioProvider()
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+def enqueue_alert(db: Session, to_number: str, body: str, dedup_key: str = None, commit: bool = True):
+    """
+    Writes an alert to the outbox. Returns the new alert id, or None when an
+    alert with the same `dedup_key` was already queued within ALERT_DEDUP_WINDOW.
+    Concurrent enqueues that both pass the window check are settled by the
+    partial unique index on pending dedup keys (the second insert is a no-op).
+    With commit=False the caller commits and then calls alert_dispatcher.wake().
+    """
+    if dedup_key:
+        since = datetime.utcnow() - timedelta(seconds=ALERT_DEDUP_WINDOW)
+        duplicate = db.query(models.AlertOutbox.id).filter(
+            models.AlertOutbox.dedup_key == dedup_key,
+            models.AlertOutbox.created_at >= since,
+            models.AlertOutbox.status != "failed",
+        ).first()
+        if duplicate:
+            alert_dispatcher.counters["deduped"] += 1
+            return None
+
+    now = datetime.utcnow()
+    stmt = sqlite_insert(models.AlertOutbox).values(
+        to_number=to_number, body=body, dedup_key=dedup_key, status="pending",
+        attempts=0, next_attempt_at=now, created_at=now,
+    ).on_conflict_do_nothing().returning(models.AlertOutbox.id)
+    alert_id = db.execute(stmt).scalar()
+    if alert_id is None:
+        alert_dispatcher.counters["deduped"] += 1
+        return None
+    if commit:
+        db.commit()
+        alert_dispatcher.wake()
+    return alert_id
+
+class AlertDispatcher:
+    """
+    Background worker draining the alert outbox: claims due rows in batches,
+    sends them concurrently under a rate limit, and reschedules failures with
+    exponential backoff until ALERT_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, provider=None):
+        self.provider = provider or build_provider()
+        self._task = None
+        self._wake = None
+        self.counters = {"sent": 0, "retried": 0, "failed": 0, "deduped": 0}
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        # Rows left in "sending" by a crash are retried
+        await asyncio.to_thread(self._requeue_stuck)
+        self._wake = asyncio.Event()
+        self._limiter = RateLimiter(ALERT_RATE_PER_SEC, burst=ALERT_CONCURRENCY)
+        self._slots = asyncio.Semaphore(ALERT_CONCURRENCY)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Alert dispatcher started (provider={self.provider.name}, {ALERT_RATE_PER_SEC}/s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                batch = await asyncio.to_thread(self._claim_due)
+            except Exception as e:
+                logger.error(f"Alert outbox poll failed: {e}")
+                batch = []
+
+            if batch:
+                await asyncio.gather(*[self._deliver(*alert) for alert in batch])
+                continue
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), ALERT_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(self, alert_id, to_number, body, attempts):
+        async with self._slots:
+            await self._limiter.acquire()
+            try:
+                ok = await self.provider.send(to_number, body)
+                error = None if ok else "provider returned failure"
+            except Exception as e:
+                ok, error = False, str(e)
+        try:
+            await asyncio.to_thread(self._record, alert_id, attempts + 1, ok, error)
+        except Exception as e:
+            # Left "sending": re-queued by _requeue_stuck on the next start
+            logger.error(f"Could not record delivery of alert {alert_id} (sent={ok}): {e}")
+
+    def _requeue_stuck(self):
+        db = SessionLocal()
+        try:
+            db.query(models.AlertOutbox).filter(models.AlertOutbox.status == "sending") \
+                .update({"status": "pending"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_due(self):
+        db = SessionLocal()
+        try:
+            rows = db.query(models.AlertOutbox).filter(
+                models.AlertOutbox.status == "pending",
+                models.AlertOutbox.next_attempt_at <= datetime.utcnow(),
+            ).order_by(models.AlertOutbox.next_attempt_at).limit(ALERT_BATCH_SIZE).all()
+            claimed = [(r.id, r.to_number, r.body, r.attempts or 0) for r in rows]
+            for r in rows:
+                r.status = "sending"
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _record(self, alert_id, attempts, ok, error):
+        db = SessionLocal()
+        try:
+            alert = db.get(models.AlertOutbox, alert_id)
+            alert.attempts = attempts
+            if ok:
+                alert.status = "sent"
+                alert.sent_at = datetime.utcnow()
+                self.counters["sent"] += 1
+            elif attempts >= ALERT_MAX_ATTEMPTS:
+                alert.status = "failed"
+                alert.last_error = error
+                self.counters["failed"] += 1
+            else:
+                delay = ALERT_BACKOFF_BASE ** attempts * random.uniform(0.8, 1.2)
+                alert.status = "pending"
+                alert.last_error = error
+                alert.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                self.counters["retried"] += 1
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self):
+        db = SessionLocal()
+        try:
+            depth = db.query(models.AlertOutbox).filter(
+                models.AlertOutbox.status.in_(("pending", "sending"))).count()
+        finally:
+            db.close()
+        return {
+            "provider": self.provider.name,
+            "running": self._task is not None and not self._task.done(),
+            "queue_depth": depth,
+            "rate_per_sec": ALERT_RATE_PER_SEC,
+            **self.counters,
+        }
+
+alert_dispatcher = AlertDispatcher()
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import tarfile
+import uuid
+import zipfile
+
+import crud
+from database import SessionLocal
+from services.ai_service import ai_service
+from services.inference_executor import ExecutorSaturated, INFERENCE_MAX_PENDING
+from services.alert_outbox import alert_dispatcher, enqueue_alert, ALERT_SMS_TO
+from services.ingest import ingest_chunks, ingest_upload, release_upload, UploadTooLarge, IMAGE_EXTENSIONS, UPLOAD_CHUNK_KB
+from services.field_map import FieldMap, field_maps, read_gps
+
+logger = logging.getLogger(__name__)
+
+# Whole request (all images / archives) for one batch
+BATCH_MAX_MB = float(os.getenv("BATCH_MAX_MB", "20480"))
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "5000"))
+# Images analysed at once; kept under the executor's admission limit so single uploads still get in
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(max(1, INFERENCE_MAX_PENDING // 2))))
+# Results are written with one bulk insert per this many images, or after BATCH_FLUSH_S
+BATCH_DB_CHUNK = int(os.getenv("BATCH_DB_CHUNK", "100"))
+BATCH_FLUSH_S = float(os.getenv("BATCH_FLUSH_S", "1.0"))
+
+ZIP_EXTENSIONS = (".zip",)
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def _is_image(name: str) -> bool:
+    base = os.path.basename(name)
+    return not base.startswith(".") and os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
+async def _sync_chunks(stream, chunk_size: int):
+    """Reads a blocking file object (archive member) off the event loop."""
+    while chunk := await asyncio.to_thread(stream.read, chunk_size):
+        yield chunk
+
+def _zip_members(fileobj):
+    archive = zipfile.ZipFile(fileobj)
+    return archive, [m for m in archive.infolist() if not m.is_dir() and _is_image(m.filename)
+                     and not m.filename.startswith("__MACOSX/")]
+
+def _tar_members(fileobj):
+    archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    return archive, [m for m in archive.getmembers() if m.isfile() and _is_image(m.name)]
+
+async def iter_images(files):
+    """
+    Yields (filename, stored, error) for every image in the uploaded files,
+    expanding zip / tar archives member by member. Each image is streamed to
+    content-addressed storage before it is yielded.
+    """
+    chunk_size = UPLOAD_CHUNK_KB * 1024
+    for upload in files:
+        name = (upload.filename or "").lower()
+        if name.endswith(ZIP_EXTENSIONS) or name.endswith(TAR_EXTENSIONS):
+            is_zip = name.endswith(ZIP_EXTENSIONS)
+            try:
+                archive, members = await asyncio.to_thread(_zip_members if is_zip else _tar_members, upload.file)
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                yield upload.filename, None, f"Unreadable archive: {e}"
+                continue
+            with archive:
+                for member in members:
+                    member_name = member.filename if is_zip else member.name
+                    stream = archive.open(member) if is_zip else archive.extractfile(member)
+                    try:
+                        stored = await ingest_chunks(_sync_chunks(stream, chunk_size), member_name)
+                        yield member_name, stored, None
+                    except UploadTooLarge as e:
+                        yield member_name, None, str(e)
+                    finally:
+                        stream.close()
+        elif (upload.content_type or "").startswith("image/") or _is_image(name):
+            try:
+                yield upload.filename, await ingest_upload(upload), None
+            except UploadTooLarge as e:
+                yield upload.filename, None, str(e)
+        else:
+            yield upload.filename, None, "Not an image or zip/tar archive"
+
+class BatchRun:
+    """
+    One batch request: images are ingested in order, analysed by
+    BATCH_CONCURRENCY workers as they arrive, and their results written with
+    bulk inserts. events() yields result / error / progress dicts as work
+    finishes and a final summary. Each image is placed by its GPS EXIF (lat /
+    lon is the fallback) and folded into the run's live FieldMap.
+    """
+
+    def __init__(self, files, user_name: str, lat: float = None, lon: float = None):
+        self.files = files
+        self.user_name = user_name
+        self.lat, self.lon = lat, lon
+        self.map_id = uuid.uuid4().hex[:12]
+        self.field_map = FieldMap()
+        self.geotagged = 0
+        field_maps.add(self.map_id, self.field_map)
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.cached = 0
+        self.pests = 0
+        self.bytes_in = 0
+        self.ingest_finished = False
+        self.started = time.perf_counter()
+
+    async def _produce(self, work: asyncio.Queue, outcomes: asyncio.Queue, workers: int):
+        try:
+            async for filename, stored, error in iter_images(self.files):
+                if self.total >= BATCH_MAX_IMAGES:
+                    if stored:
+                        release_upload(stored["path"])
+                    await outcomes.put((None, filename, None, f"Batch limit of {BATCH_MAX_IMAGES} images reached"))
+                    break
+                index = self.total
+                self.total += 1
+                if error:
+                    await outcomes.put((index, filename, None, error))
+                    continue
+                self.bytes_in += stored["size"]
+                await work.put((index, filename, stored))
+        finally:
+            self.ingest_finished = True
+            for _ in range(workers):
+                await work.put(None)
+
+    async def _analyze(self, stored):
+        delay = 0.05
+        lat, lon = self._location(stored)
+        while True:
+            try:
+                return await ai_service.analyze_image(stored["path"], user_name=self.user_name,
+                                                      content_hash=stored["sha256"], lat=lat, lon=lon)
+            except ExecutorSaturated:
+                # Interactive uploads share the executor; wait for a slot instead of failing the image
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    async def _work(self, work: asyncio.Queue, outcomes: asyncio.Queue):
+        while (item := await work.get()) is not None:
+            index, filename, stored = item
+            try:
+                stored["gps"] = await asyncio.to_thread(read_gps, stored["path"])
+                result = await self._analyze(stored)
+                result["upload"] = {k: stored[k] for k in ("sha256", "size", "duplicate")}
+                await outcomes.put((index, filename, stored, result))
+            except Exception as e:
+                logger.error(f"Batch analysis failed for {filename}: {e}")
+                await outcomes.put((index, filename, None, "AI Processing Failed"))
+            finally:
+                release_upload(stored["path"])
+
+    def _write(self, analysed):
+        """Bulk-inserts one chunk of results. Returns the new scan ids in order."""
+        db = SessionLocal()
+        try:
+            entries = [crud.records_from_analysis(result, stored["path"], self.user_name, *self._location(stored))
+                       for _, _, stored, result in analysed]
+            return crud.create_scan_entries_bulk(db, entries)
+        finally:
+            db.close()
+
+    def _location(self, stored):
+        return stored["gps"] or (self.lat, self.lon)
+
+    def _queue_alert(self):
+        """One SMS for the whole batch instead of one per image with pests."""
+        db = SessionLocal()
+        try:
+            return enqueue_alert(
+                db, ALERT_SMS_TO,
+                f"AgriScan alert: {self.pests} pests detected across {self.done} images "
+                f"in {self.user_name}'s field. Apply pesticide.",
+                dedup_key=f"field:{self.lat:.3f}:{self.lon:.3f}" if self.lat is not None else None,
+            )
+        finally:
+            db.close()
+
+    def progress(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "type": "progress",
+            "map_id": self.map_id,
+            "done": self.done,
+            "failed": self.failed,
+            "total": self.total,
+            "total_final": self.ingest_finished,
+            "cached": self.cached,
+            "elapsed_s": round(elapsed, 3),
+            "images_per_s": round(self.done / elapsed, 2) if elapsed > 0 else None,
+            "mb_per_s": round(self.bytes_in / (1024 * 1024) / elapsed, 2) if elapsed > 0 else None,
+        }
+
+    async def _flush(self, analysed, errors):
+        events = []
+        if analysed:
+            scan_ids = await asyncio.to_thread(self._write, analysed)
+            for scan_id, (index, filename, stored, result) in zip(scan_ids, analysed):
+                result["db_id"] = scan_id
+                lat, lon = self._location(stored)
+                if lat is not None:
+                    self.field_map.add_result(lat, lon, result)
+                    result["field_zone"] = self.field_map.grid.zone_of(lat, lon)
+                self.geotagged += stored["gps"] is not None
+                self.done += 1
+                self.cached += bool(result.get("cached"))
+                self.pests += int(result.get("pest_count", 0))
+                events.append({"type": "result", "index": index, "filename": filename, "result": result})
+        for index, filename, _, detail in errors:
+            self.failed += 1
+            events.append({"type": "error", "index": index, "filename": filename, "detail": detail})
+        events.append(self.progress())
+        return events
+
+    async def events(self):
+        workers = max(1, BATCH_CONCURRENCY)
+        work = asyncio.Queue(maxsize=workers * 2)  # ingest runs at most this far ahead of analysis
+        outcomes = asyncio.Queue()
+        tasks = [asyncio.create_task(self._produce(work, outcomes, workers))]
+        tasks += [asyncio.create_task(self._work(work, outcomes)) for _ in range(workers)]
+        running = asyncio.gather(*tasks)
+        finished = object()
+        running.add_done_callback(lambda _: outcomes.put_nowait(finished))
+
+        analysed, errors = [], []
+        flush_at = None
+        try:
+            while True:
+                timeout = None if flush_at is None else max(0.0, flush_at - time.monotonic())
+                try:
+                    outcome = await asyncio.wait_for(outcomes.get(), timeout)
+                except asyncio.TimeoutError:
+                    outcome = None
+                if outcome is not None and outcome is not finished:
+                    (analysed if outcome[2] is not None else errors).append(outcome)
+                    if flush_at is None:
+                        flush_at = time.monotonic() + BATCH_FLUSH_S
+                due = flush_at is not None and time.monotonic() >= flush_at
+                if analysed or errors:
+                    if outcome is finished or len(analysed) >= BATCH_DB_CHUNK or due:
+                        for event in await self._flush(analysed, errors):
+                            yield event
+                        analysed, errors, flush_at = [], [], None
+                if outcome is finished:
+                    break
+            await running  # surfaces unexpected producer / worker errors
+            if ALERT_SMS_TO and self.pests > 0 and await asyncio.to_thread(self._queue_alert) is not None:
+                alert_dispatcher.wake()
+            summary = self.progress()
+            summary["type"] = "summary"
+            summary["geotagged"] = self.geotagged
+            summary["field"] = self.field_map.summary()
+            yield summary
+        finally:
+            for task in tasks:
+                task.cancel()
+
+def format_event(event: dict, fmt: str) -> str:
+    data = json.dumps(event, default=str)
+    if fmt == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
@@ -1,8 +1,37 @@
 import logging
 import math
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+YIELD_UNIT = "Tons/Hectare"
+
+# Model coefficients (shared by the scalar and batch paths so retuning changes both)
+BASE_YIELD = 6.0        # Tons/Ha, ideal yield for this crop type (e.g., Wheat/Rice)
+PEST_DECAY = 0.85       # 15% drop per pest
+HEAT_STRESS_TEMP = 35
+HEAT_PENALTY = 0.15
+FUNGAL_HUMIDITY = 85
+FUNGAL_PENALTY = 0.10
+N_LOW_PENALTY = 0.20
+K_LOW_PENALTY = 0.10
+MIN_YIELD = 0.5
+LOW_TREND_BELOW = 3.0
+AVERAGE_TREND_BELOW = 4.5
+MODEL_CONFIDENCE = 0.85 # Mock confidence from 'model'
+
+BATCH_COLUMNS = ("health_index", "pest_count", "weather_temp", "weather_humidity", "n_level", "k_level")
+
+def yield_forecast(amount, trend, confidence=None, unit=YIELD_UNIT):
+    """Forecast dict: typed amount/unit plus the display string the frontend shows."""
+    return {
+        "value": f"{amount} {unit}" if amount is not None else "N/A",
+        "amount": amount,
+        "unit": unit if amount is not None else None,
+        "trend": trend,
+        "confidence": confidence
+    }
+
 class FarmVibesYieldEngine:
     """
     Adapter for Microsoft FarmVibes.AI logic.
@@ -25,11 +54,12 @@ class FarmVibesYieldEngine:
             k_level (str): Potassium Status
             
         Returns:
-            dict: { "value": "X.X Tons/Hectare", "trend": "High/Avg/Low" }
+            dict: { "value": "X.X Tons/Hectare", "amount": X.X, "unit": "Tons/Hectare",
+                    "trend": "High/Avg/Low", "confidence": 0.85 }
         """
         try:
             # Base Yield (Ideal) for this crop type (e.g., Wheat/Rice)
-            base_yield = 6.0 # Tons/Ha
+            base_yield = BASE_YIELD # Tons/Ha
             
             # --- Factor 1: Health Impact (FarmVibes Vigor Index Logic) ---
             # Health Score acts as a coefficient (0.0 to 1.0)
@@ -37,37 +67,90 @@ class FarmVibesYieldEngine:
             
             # --- Factor 2: Pest Stress Penalty ---
             # Exponential decay based on pest count
-            pest_penalty = math.pow(0.85, pest_count) # 15% drop per pest
+            pest_penalty = math.pow(PEST_DECAY, pest_count) # 15% drop per pest
             
             # --- Factor 3: Environmental Stress (DeepMC Logic) ---
             env_penalty = 1.0
-            if weather_temp > 35: env_penalty -= 0.15 # Heat Stress
-            if weather_humidity > 85: env_penalty -= 0.10 # Fungal Risk
+            if weather_temp > HEAT_STRESS_TEMP: env_penalty -= HEAT_PENALTY # Heat Stress
+            if weather_humidity > FUNGAL_HUMIDITY: env_penalty -= FUNGAL_PENALTY # Fungal Risk
             
             # --- Factor 4: Nutrient Deficiency ---
             nutrient_penalty = 1.0
-            if n_level == "Low": nutrient_penalty -= 0.20 # Severe impact
-            if k_level == "Low": nutrient_penalty -= 0.10
+            if n_level == "Low": nutrient_penalty -= N_LOW_PENALTY # Severe impact
+            if k_level == "Low": nutrient_penalty -= K_LOW_PENALTY
             
             # Calculate Final Yield
             predicted_tonnage = base_yield * health_factor * pest_penalty * env_penalty * nutrient_penalty
             
             # Min cap
-            predicted_tonnage = max(0.5, round(predicted_tonnage, 2))
+            predicted_tonnage = max(MIN_YIELD, round(predicted_tonnage, 2))
             
             # Determine Trend
             trend = "High"
-            if predicted_tonnage < 3.0: trend = "Low"
-            elif predicted_tonnage < 4.5: trend = "Average"
+            if predicted_tonnage < LOW_TREND_BELOW: trend = "Low"
+            elif predicted_tonnage < AVERAGE_TREND_BELOW: trend = "Average"
             
-            return {
-                "value": f"{predicted_tonnage} Tons/Hectare",
-                "trend": trend,
-                "confidence": 0.85 # Mock confidence from 'model'
-            }
+            return yield_forecast(predicted_tonnage, trend, confidence=MODEL_CONFIDENCE)
             
         except Exception as e:
             logger.error(f"FarmVibes Prediction Error: {e}")
-            return {"value": "N/A", "trend": "Unknown"}
+            return yield_forecast(None, "Unknown")
+
+    def predict_yield_batch(self, health_index, pest_count, weather_temp, weather_humidity,
+                            n_level, k_level) -> dict:
+        """
+        Vectorized predict_yield over equal-length arrays (one row per scan / scenario).
+        Results are bit-identical to the scalar path, including round() semantics.
+
+        Returns:
+            dict of arrays: { "amount": float64 (NaN where inputs are missing),
+                              "trend": str ("Unknown" where amount is NaN),
+                              "confidence": float64 }
+        """
+        # Scalars / 0-d arrays become length-1 columns and broadcast against the others
+        health, pests, temp, humidity = np.broadcast_arrays(*(
+            np.atleast_1d(np.asarray(v, dtype=np.float64))
+            for v in (health_index, pest_count, weather_temp, weather_humidity)))
+        n_level, k_level = (np.broadcast_to(np.atleast_1d(np.asarray(v)), health.shape) for v in (n_level, k_level))
+
+        # Same operation order as the scalar path so every intermediate rounds identically
+        pest_penalty = np.power(PEST_DECAY, pests)
+        env_penalty = np.ones_like(health)
+        env_penalty[temp > HEAT_STRESS_TEMP] -= HEAT_PENALTY
+        env_penalty[humidity > FUNGAL_HUMIDITY] -= FUNGAL_PENALTY
+        nutrient_penalty = np.ones_like(health)
+        nutrient_penalty[n_level == "Low"] -= N_LOW_PENALTY
+        nutrient_penalty[k_level == "Low"] -= K_LOW_PENALTY
+
+        tonnage = BASE_YIELD * (health / 100.0) * pest_penalty * env_penalty * nutrient_penalty
+        amount = np.maximum(MIN_YIELD, _round2(tonnage))
+
+        valid = np.isfinite(health) & np.isfinite(pests) & np.isfinite(temp) & np.isfinite(humidity)
+        amount[~valid] = np.nan
+        trend = np.where(amount < LOW_TREND_BELOW, "Low",
+                         np.where(amount < AVERAGE_TREND_BELOW, "Average", "High"))
+        trend[~valid] = "Unknown"
+        return {
+            "amount": amount,
+            "trend": trend,
+            "confidence": np.where(valid, MODEL_CONFIDENCE, np.nan),
+        }
+
+    def predict_yield_table(self, table) -> dict:
+        """predict_yield_batch over a columnar table (dict of arrays, DataFrame, ...) keyed by BATCH_COLUMNS."""
+        return self.predict_yield_batch(*(table[col] for col in BATCH_COLUMNS))
+
+def _round2(values):
+    """
+    Python's round(x, 2) for arrays. np.round scales by 100 first, which can land
+    on the wrong side of a .5 tie; those few values are re-rounded with round().
+    """
+    values = np.atleast_1d(values)
+    scaled = values * 100.0
+    rounded = np.rint(scaled) / 100.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
 
 farmvibes_engine = FarmVibesYieldEngine()
@@ -0,0 +1,273 @@
+import io
+import os
+import math
+import logging
+from collections import Counter, OrderedDict
+import numpy as np
+
+import crud
+from services.scoring import NUTRIENT_ACTIONS
+
+logger = logging.getLogger(__name__)
+
+# Field anchor: the grid origin (ideally the field's north-west corner) and the
+# location filed for images that carry no GPS EXIF
+DEFAULT_FIELD_LAT = float(os.getenv("FIELD_ORIGIN_LAT", "20.296"))
+DEFAULT_FIELD_LON = float(os.getenv("FIELD_ORIGIN_LON", "85.824"))
+FIELD_CELL_M = float(os.getenv("FIELD_CELL_M", "10"))
+# A zone is FIELD_ZONE_CELLS x FIELD_ZONE_CELLS cells; zones are named A1, A2 ... B1 from the origin
+FIELD_ZONE_CELLS = int(os.getenv("FIELD_ZONE_CELLS", "5"))
+# A nutrient is reported Low for a zone when at least this share of its images read Low
+FIELD_LOW_SHARE = float(os.getenv("FIELD_LOW_SHARE", "0.5"))
+# Live flight maps kept in memory for /api/v1/fields/maps/{id}
+FIELD_MAPS_KEPT = int(os.getenv("FIELD_MAPS_KEPT", "20"))
+
+METRES_PER_DEG_LAT = 110_540.0
+METRES_PER_DEG_LON = 111_320.0  # at the equator, scaled by cos(latitude)
+
+GPS_IFD = 0x8825
+GPS_LAT_REF, GPS_LAT, GPS_LON_REF, GPS_LON = 1, 2, 3, 4
+
+def gps_from_exif(gps: dict):
+    """(lat, lon) in decimal degrees from an EXIF GPS IFD, or None when it has no usable fix."""
+    try:
+        def degrees(dms):
+            d, m, s = (float(v) for v in dms)
+            return d + m / 60.0 + s / 3600.0
+        lat, lon = degrees(gps[GPS_LAT]), degrees(gps[GPS_LON])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+    if str(gps.get(GPS_LAT_REF, "N")).upper().startswith("S"):
+        lat = -lat
+    if str(gps.get(GPS_LON_REF, "E")).upper().startswith("W"):
+        lon = -lon
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+def read_gps(image):
+    """GPS position from an image's EXIF (a path or encoded bytes; only the header is parsed), or None."""
+    try:
+        from PIL import Image  # deferred: only needed once images arrive
+        source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+        with Image.open(source) as img:
+            return gps_from_exif(img.getexif().get_ifd(GPS_IFD))
+    except Exception as e:
+        # Missing or corrupt EXIF never fails an upload; the image is filed at the field origin
+        logger.debug(f"No GPS EXIF: {e}")
+        return None
+
+def zone_label(zone_row: int, zone_col: int) -> str:
+    if 0 <= zone_row < 26 and zone_col >= 0:
+        return f"{chr(ord('A') + zone_row)}{zone_col + 1}"
+    return f"Z{zone_row}:{zone_col}"  # outside the field's north-west origin
+
+class FieldGrid:
+    """Equirectangular metre grid anchored at the field origin; rows grow southward, columns eastward."""
+
+    def __init__(self, origin_lat=DEFAULT_FIELD_LAT, origin_lon=DEFAULT_FIELD_LON,
+                 cell_m=FIELD_CELL_M, zone_cells=FIELD_ZONE_CELLS):
+        self.origin_lat, self.origin_lon = origin_lat, origin_lon
+        self.cell_m = cell_m
+        self.zone_cells = max(1, zone_cells)
+        self._lon_scale = METRES_PER_DEG_LON * math.cos(math.radians(origin_lat))
+
+    def cell(self, lat: float, lon: float):
+        north = (lat - self.origin_lat) * METRES_PER_DEG_LAT
+        east = (lon - self.origin_lon) * self._lon_scale
+        return math.floor(-north / self.cell_m), math.floor(east / self.cell_m)
+
+    def cell_center(self, row: int, col: int):
+        lat = self.origin_lat - (row + 0.5) * self.cell_m / METRES_PER_DEG_LAT
+        lon = self.origin_lon + (col + 0.5) * self.cell_m / self._lon_scale
+        return lat, lon
+
+    def zone(self, row: int, col: int):
+        return row // self.zone_cells, col // self.zone_cells
+
+    def zone_of(self, lat: float, lon: float) -> str:
+        return zone_label(*self.zone(*self.cell(lat, lon)))
+
+class CellStats:
+    """Running aggregates for one grid cell (or zone); images themselves are never kept."""
+    __slots__ = ("images", "health_count", "health_sum", "health_min", "health_max", "pests", "low", "labels")
+
+    def __init__(self):
+        self.images = 0
+        self.health_count = 0
+        self.health_sum = 0.0
+        self.health_min = None
+        self.health_max = None
+        self.pests = 0
+        self.low = {"n": 0, "p": 0, "k": 0}
+        self.labels = Counter()
+
+    def add(self, health, pests, levels):
+        self.images += 1
+        if health is not None:
+            health = float(health)
+            self.health_count += 1
+            self.health_sum += health
+            self.health_min = health if self.health_min is None else min(self.health_min, health)
+            self.health_max = health if self.health_max is None else max(self.health_max, health)
+        self.pests += int(pests or 0)
+        for nutrient, level in levels.items():
+            if level == "Low":
+                self.low[nutrient] += 1
+
+    def merge(self, other: "CellStats"):
+        self.images += other.images
+        self.health_count += other.health_count
+        self.health_sum += other.health_sum
+        for attr, pick in (("health_min", min), ("health_max", max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, theirs if mine is None else mine if theirs is None else pick(mine, theirs))
+        self.pests += other.pests
+        for nutrient in self.low:
+            self.low[nutrient] += other.low[nutrient]
+        self.labels.update(other.labels)
+
+    @property
+    def health_mean(self):
+        return self.health_sum / self.health_count if self.health_count else None
+
+    def low_share(self, nutrient: str):
+        return self.low[nutrient] / self.images if self.images else 0.0
+
+class FieldMap:
+    """
+    Incremental field raster: each analysed image is folded into the cell
+    under its GPS position in O(1), so a flight of any size needs memory only
+    per occupied cell. Zones (blocks of cells) get NPK, pest and health summaries.
+    """
+    METRICS = ("health_mean", "health_min", "pests", "images", "n_low_share", "p_low_share", "k_low_share")
+
+    def __init__(self, grid: FieldGrid = None):
+        self.grid = grid or FieldGrid()
+        self.cells = {}  # (row, col) -> CellStats
+        self.images = 0
+
+    def _cell(self, lat, lon):
+        key = self.grid.cell(lat, lon)
+        stats = self.cells.get(key)
+        if stats is None:
+            stats = self.cells[key] = CellStats()
+        return stats
+
+    def add(self, lat: float, lon: float, health=None, pests=0, n_level=None, p_level=None, k_level=None,
+            labels=()):
+        self._cell(lat, lon).add(health, pests, {"n": n_level, "p": p_level, "k": k_level})
+        if labels:
+            self.add_labels(lat, lon, labels)
+        self.images += 1
+
+    def add_labels(self, lat: float, lon: float, labels):
+        self._cell(lat, lon).labels.update(labels)
+
+    def add_result(self, lat: float, lon: float, result: dict):
+        """Folds one AIService analysis dict in."""
+        self.add(lat, lon, result.get("health_score"), result.get("pest_count", 0),
+                 result.get("n_level"), result.get("p_level"), result.get("k_level"),
+                 [d.get("label") for d in result.get("pest_detections") or [] if d.get("label")])
+
+    @staticmethod
+    def _metric(stats: CellStats, metric: str):
+        if metric.endswith("_low_share"):
+            return stats.low_share(metric[0])
+        return getattr(stats, metric)
+
+    def raster(self, metric: str = "health_mean"):
+        """Dense grid of one metric over the occupied extent (None for cells without images)."""
+        if metric not in self.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if not self.cells:
+            return {"metric": metric, "cell_m": self.grid.cell_m, "origin_cell": None, "values": []}
+        rows = [r for r, _ in self.cells]
+        cols = [c for _, c in self.cells]
+        top, left = min(rows), min(cols)
+        grid = np.full((max(rows) - top + 1, max(cols) - left + 1), np.nan)
+        for (r, c), stats in self.cells.items():
+            value = self._metric(stats, metric)
+            if value is not None:
+                grid[r - top, c - left] = value
+        values = [[None if np.isnan(v) else round(float(v), 3) for v in row] for row in grid]
+        north_west = self.grid.cell_center(top, left)
+        return {
+            "metric": metric,
+            "cell_m": self.grid.cell_m,
+            "origin_cell": [top, left],
+            "north_west_center": [round(north_west[0], 7), round(north_west[1], 7)],
+            "values": values,
+        }
+
+    def zones(self):
+        merged = {}
+        for (r, c), stats in self.cells.items():
+            key = self.grid.zone(r, c)
+            if key not in merged:
+                merged[key] = CellStats()
+            merged[key].merge(stats)
+
+        summaries = []
+        for (zr, zc), stats in sorted(merged.items()):
+            name = zone_label(zr, zc)
+            npk = {nutrient: "Low" if stats.low_share(nutrient) >= FIELD_LOW_SHARE else "Optimal"
+                   for nutrient in ("n", "p", "k")}
+            actions = [f"Zone {name}: {NUTRIENT_ACTIONS[n]}" for n, level in npk.items() if level == "Low"]
+            if stats.pests:
+                actions.append(f"Zone {name}: Pests found ({stats.pests}): Apply pesticide.")
+            mean = stats.health_mean
+            summaries.append({
+                "zone": name,
+                "images": stats.images,
+                "health": {
+                    "mean": round(mean, 2) if mean is not None else None,
+                    "min": stats.health_min,
+                    "max": stats.health_max,
+                },
+                "pests": stats.pests,
+                "pests_per_image": round(stats.pests / stats.images, 3) if stats.images else 0.0,
+                "top_labels": dict(stats.labels.most_common(3)),
+                "n_level": npk["n"], "p_level": npk["p"], "k_level": npk["k"],
+                "low_share": {n: round(stats.low_share(n), 3) for n in ("n", "p", "k")},
+                "actions": actions or [f"Zone {name}: Crop is healthy. Continue monitoring."],
+            })
+        return summaries
+
+    def summary(self):
+        return {
+            "images": self.images,
+            "cells": len(self.cells),
+            "cell_m": self.grid.cell_m,
+            "zone_m": self.grid.cell_m * self.grid.zone_cells,
+            "origin": [self.grid.origin_lat, self.grid.origin_lon],
+            "zones": self.zones(),
+        }
+
+def build_field_map(db, user_name=None, since=None, until=None) -> FieldMap:
+    """Field map of stored scans, folded in row by row (never the whole flight in memory)."""
+    field_map = FieldMap()
+    for lat, lon, health, pests, n_level, p_level, k_level in crud.iter_field_points(db, user_name, since, until):
+        field_map.add(lat, lon, health, pests, n_level, p_level, k_level)
+    for lat, lon, label in crud.iter_field_labels(db, user_name, since, until):
+        if label:
+            field_map.add_labels(lat, lon, (label,))
+    return field_map
+
+class FieldMapRegistry:
+    """Most recent live flight maps (batch uploads), evicted oldest first."""
+
+    def __init__(self, keep: int = FIELD_MAPS_KEPT):
+        self.keep = max(1, keep)
+        self._maps = OrderedDict()
+
+    def add(self, map_id: str, field_map: FieldMap):
+        self._maps[map_id] = field_map
+        while len(self._maps) > self.keep:
+            self._maps.popitem(last=False)
+
+    def get(self, map_id: str):
+        return self._maps.get(map_id)
+
+field_grid = FieldGrid()
+field_maps = FieldMapRegistry()
@@ -0,0 +1,120 @@
+import os
+import asyncio
+import logging
+import importlib.util
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "5.0"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.0"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# Upper bound on concurrent requests to any single upstream host
+HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "10"))
+
+class HTTPClientRegistry:
+    """
+    Application-lifetime outbound HTTP clients.
+
+    One pooled httpx.AsyncClient (keep-alive, HTTP/2 when the `h2` package is
+    installed) is opened at FastAPI startup and closed at shutdown; every
+    integration goes through `request()` so per-host concurrency limits and
+    utilization stats apply uniformly. The Twilio SDK client is cached here
+    too, so its underlying requests.Session is reused between alerts.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._twilio = None
+        self._host_limits = {}
+        self._in_flight = {}
+        self.counters = {"requests": 0, "errors": 0, "limited_waits": 0}
+        self.http2 = importlib.util.find_spec("h2") is not None
+
+    def _build_client(self):
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+
+    async def startup(self):
+        if self._client is None:
+            self._client = self._build_client()
+            logger.info(f"HTTP client pool opened (http2={self.http2}, max_connections={HTTP_MAX_CONNECTIONS})")
+
+    async def shutdown(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._host_limits.clear()
+
+    @property
+    def client(self):
+        # Scripts outside the FastAPI lifecycle (e.g. test_weather.py) get a pool on first use
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _host_limit(self, host):
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+        return limit
+
+    async def request(self, method: str, url: str, **kwargs):
+        host = urlsplit(url).netloc
+        limit = self._host_limit(host)
+        if limit.locked():
+            self.counters["limited_waits"] += 1
+        async with limit:
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+            self.counters["requests"] += 1
+            try:
+                return await self.client.request(method, url, **kwargs)
+            except Exception:
+                self.counters["errors"] += 1
+                raise
+            finally:
+                self._in_flight[host] -= 1
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    def twilio_client(self, account_sid: str, auth_token: str):
+        if self._twilio is None:
+            from twilio.rest import Client
+            self._twilio = Client(account_sid, auth_token)
+        return self._twilio
+
+    def stats(self):
+        pool = {"open": 0, "idle": 0, "active": 0}
+        try:
+            # httpcore internals: best effort, only used for reporting
+            for conn in self._client._transport._pool.connections:
+                pool["open"] += 1
+                if conn.is_idle():
+                    pool["idle"] += 1
+                else:
+                    pool["active"] += 1
+        except Exception:
+            pass
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "per_host_limit": HTTP_PER_HOST_LIMIT,
+            "connections": pool,
+            "utilization": round(pool["active"] / HTTP_MAX_CONNECTIONS, 3),
+            "in_flight": {host: n for host, n in self._in_flight.items() if n},
+            **self.counters,
+        }
+
+http_registry = HTTPClientRegistry()
@@ -0,0 +1,20 @@
+import numpy as np
+
+def decode_image(data: bytes):
+    """Decodes encoded image bytes (JPEG/PNG/...) straight to a BGR ndarray, no disk round trip."""
+    import cv2  # deferred: keeps app import fast
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def load_image(image):
+    """
+    Normalizes the accepted image inputs to one decoded BGR ndarray:
+    an ndarray is passed through untouched, bytes are decoded in memory,
+    and a path is read from disk.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image(bytes(image))
+    import cv2
+    return cv2.imread(str(image))
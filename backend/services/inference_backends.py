@@ -0,0 +1,256 @@
+import os
+import logging
+import threading
+import numpy as np
+
+from services.tiling import nms
+
+logger = logging.getLogger(__name__)
+
+# "auto" picks the engine from the model file: .onnx -> onnx, .xml / *_openvino_model -> openvino, else torch
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "auto").lower()
+# Intra-op threads per model instance; 0 = let the inference executor decide
+INFERENCE_BACKEND_THREADS = int(os.getenv("INFERENCE_BACKEND_THREADS", "0"))
+INFERENCE_IMGSZ = int(os.getenv("INFERENCE_IMGSZ", "640"))
+INFERENCE_CONF = float(os.getenv("INFERENCE_CONF", "0.25"))
+INFERENCE_IOU = float(os.getenv("INFERENCE_IOU", "0.7"))
+# Largest batch a dynamic-shape ONNX/OpenVINO model is fed at once (the input buffer is sized for it)
+INFERENCE_BACKEND_MAX_BATCH = int(os.getenv("INFERENCE_BACKEND_MAX_BATCH", "8"))
+
+def boxes_from_results(results):
+    """Converts ultralytics Results into plain (x1, y1, x2, y2, conf) tuples per image."""
+    outputs = []
+    for result in results:
+        boxes = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = box.xyxy[0].tolist()
+            boxes.append((x1, y1, x2, y2, float(box.conf[0])))
+        outputs.append(boxes)
+    return outputs
+
+class InferenceBackend:
+    """
+    One loaded detector. predict() takes a list of BGR uint8 images and returns
+    [(x1, y1, x2, y2, conf), ...] per image in original pixel coordinates.
+    """
+    name = "base"
+
+    def __init__(self, model_path: str, threads: int = 1, imgsz: int = INFERENCE_IMGSZ,
+                 conf: float = INFERENCE_CONF, iou: float = INFERENCE_IOU):
+        self.model_path = model_path
+        self.threads = max(1, threads)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+
+    def predict(self, images):
+        raise NotImplementedError
+
+    def warmup(self, runs: int = 1):
+        """Runs dummy frames through the model so first real requests skip lazy init."""
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.predict([dummy])
+
+    def describe(self):
+        return {"backend": self.name, "model_path": self.model_path, "threads": self.threads, "imgsz": self.imgsz}
+
+class TorchBackend(InferenceBackend):
+    """ultralytics YOLO on PyTorch (.pt). Also loads any format ultralytics can export."""
+    name = "torch"
+
+    def __init__(self, model_path, threads=1, **kwargs):
+        super().__init__(model_path, threads, **kwargs)
+        import torch
+        from ultralytics import YOLO
+        torch.set_num_threads(self.threads)
+        self.model = YOLO(model_path)
+
+    def predict(self, images):
+        results = self.model(images, imgsz=self.imgsz, conf=self.conf, iou=self.iou, verbose=False)
+        return boxes_from_results(results)
+
+class _LetterboxBuffer:
+    """
+    Pre-allocated NCHW float32 input. Images are letterboxed straight into it,
+    so steady-state inference allocates no new input arrays.
+    """
+
+    def __init__(self, batch: int, imgsz: int):
+        self.imgsz = imgsz
+        self.array = np.full((batch, 3, imgsz, imgsz), 114 / 255.0, dtype=np.float32)
+        self._canvas = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+
+    def fill(self, images):
+        """Writes images into slots 0..n-1. Returns (scale, pad_x, pad_y) per image."""
+        import cv2
+        transforms = []
+        for slot, img in enumerate(images):
+            h, w = img.shape[:2]
+            scale = min(self.imgsz / h, self.imgsz / w)
+            nh, nw = int(round(h * scale)), int(round(w * scale))
+            pad_y, pad_x = (self.imgsz - nh) // 2, (self.imgsz - nw) // 2
+            self._canvas.fill(114)
+            self._canvas[pad_y:pad_y + nh, pad_x:pad_x + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+            # BGR HWC uint8 -> RGB CHW float in [0, 1], written in place
+            np.multiply(self._canvas[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=self.array[slot],
+                        casting="unsafe")
+            transforms.append((scale, pad_x, pad_y))
+        return transforms
+
+def decode_yolov8(output, transforms, conf: float, iou: float):
+    """
+    Turns raw YOLOv8 detect output (batch, 4 + classes, anchors) into per-image
+    box tuples in original image coordinates (class-agnostic NMS).
+    """
+    results = []
+    for pred, (scale, pad_x, pad_y) in zip(output, transforms):
+        pred = pred.T  # (anchors, 4 + classes)
+        scores = pred[:, 4:].max(axis=1)
+        keep = scores > conf
+        pred, scores = pred[keep], scores[keep]
+        if not len(scores):
+            results.append([])
+            continue
+        cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+        xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - pad_x) / scale
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - pad_y) / scale
+        kept = nms(xyxy, scores, iou)
+        results.append([(*map(float, xyxy[i]), float(scores[i])) for i in kept])
+    return results
+
+class _ExportedBackend(InferenceBackend):
+    """
+    Shared batching for exported graphs: fixed-batch models are fed one image at a time.
+    predict() is called from several threads at once (executor tiles, the
+    micro-batcher, video pipelines), so each thread gets its own input buffer
+    and engine runner (IO binding / infer request); the compiled model is shared.
+    """
+
+    def _setup_buffer(self, batch_dim):
+        # Static batch (exported with dynamic=False) vs symbolic/-1 batch
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        self.max_batch = self.fixed_batch or max(1, INFERENCE_BACKEND_MAX_BATCH)
+        self._local = threading.local()
+
+    def _thread_state(self):
+        state = self._local
+        if not hasattr(state, "buffer"):
+            state.buffer = _LetterboxBuffer(self.max_batch, self.imgsz)
+            state.runner = self._new_runner()
+        return state
+
+    def predict(self, images):
+        state = self._thread_state()
+        outputs = []
+        step = self.fixed_batch or self.max_batch
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            transforms = state.buffer.fill(chunk)
+            n = self.fixed_batch or len(chunk)
+            raw = self._run(state.runner, state.buffer.array[:n])
+            outputs.extend(decode_yolov8(raw[:len(chunk)], transforms, self.conf, self.iou))
+        return outputs
+
+    def _new_runner(self):
+        raise NotImplementedError
+
+    def _run(self, runner, batch):
+        raise NotImplementedError
+
+class OnnxRuntimeBackend(_ExportedBackend):
+    """
+    ONNX Runtime CPU session. Inputs are bound once per call from the
+    pre-allocated buffer (IO binding per thread, no per-call input copies). QDQ / QOperator
+    INT8 models produced by onnxruntime.quantization run unchanged.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path, threads=1, **kwargs):
+        super().__init__(model_path, threads, **kwargs)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+        self._setup_buffer(model_input.shape[0])
+
+    def _new_runner(self):
+        binding = self.session.io_binding()
+        binding.bind_output(self.output_name, "cpu")
+        return binding
+
+    def _run(self, binding, batch):
+        binding.bind_cpu_input(self.input_name, batch)
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+class OpenVINOBackend(_ExportedBackend):
+    """
+    OpenVINO CPU runtime on an IR model (the *_openvino_model/ directory or its
+    .xml). Each thread's infer request reads straight from its pre-allocated buffer.
+    NNCF INT8 IRs (ultralytics export int8=True) load like FP32 ones.
+    """
+    name = "openvino"
+
+    def __init__(self, model_path, threads=1, **kwargs):
+        super().__init__(model_path, threads, **kwargs)
+        import openvino as ov
+        xml = model_path
+        if os.path.isdir(model_path):
+            xml = next(os.path.join(model_path, f) for f in sorted(os.listdir(model_path)) if f.endswith(".xml"))
+        core = ov.Core()
+        model = core.read_model(xml)
+        shape = model.inputs[0].get_partial_shape()
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+        self.compiled = core.compile_model(model, "CPU", {
+            "INFERENCE_NUM_THREADS": self.threads,
+            "PERFORMANCE_HINT": "LATENCY",
+        })
+        self._setup_buffer(shape[0].get_length() if shape[0].is_static else None)
+        self._ov = ov
+
+    def _new_runner(self):
+        return self.compiled.create_infer_request()
+
+    def _run(self, request, batch):
+        # Wraps the buffer slice without copying it
+        request.set_input_tensor(self._ov.Tensor(batch, shared_memory=True))
+        request.infer()
+        # The output tensor is reused by the next infer(); decode from a copy
+        return request.get_output_tensor(0).data.copy()
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "onnx": OnnxRuntimeBackend,
+    "openvino": OpenVINOBackend,
+}
+
+def resolve_backend_name(model_path: str, backend: str = INFERENCE_BACKEND):
+    if backend != "auto":
+        return backend
+    path = model_path.rstrip("/")
+    if path.endswith(".onnx"):
+        return "onnx"
+    if path.endswith(".xml") or path.endswith("_openvino_model"):
+        return "openvino"
+    return "torch"
+
+def build_backend(model_path: str, backend: str = INFERENCE_BACKEND, threads: int = None, **kwargs):
+    """Loads `model_path` with the configured engine. Import errors propagate (the caller falls back to mock mode)."""
+    name = resolve_backend_name(model_path, backend)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name}")
+    threads = INFERENCE_BACKEND_THREADS or threads or 1
+    instance = BACKENDS[name](model_path, threads=threads, **kwargs)
+    logger.info(f"Inference backend ready: {instance.describe()}")
+    return instance
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from services.inference_backends import build_backend
+
+logger = logging.getLogger(__name__)
+
+CPU_COUNT = os.cpu_count() or 2
+
+# "thread" runs inference in-process; "process" keeps a preloaded model in each worker process
+INFERENCE_POOL = os.getenv("INFERENCE_POOL", "thread").lower()
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(max(1, CPU_COUNT // 2))))
+INFERENCE_PROCESSES = int(os.getenv("INFERENCE_PROCESSES", "2"))
+# Max analyses admitted at once (running + waiting); beyond this uploads get a 503
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "32"))
+
+class ExecutorSaturated(Exception):
+    """Raised when the inference executor has no free admission slots."""
+
+def configure_native_threads(num_threads: int):
+    """
+    Caps OpenCV / torch intra-op threads so that N pool workers x M native
+    threads does not oversubscribe the CPU.
+    """
+    try:
+        import cv2
+        cv2.setNumThreads(num_threads)
+    except Exception:
+        pass
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except Exception:
+        pass
+
+# --- Process worker state (one model per worker process) ---
+_worker_model = None
+
+def _init_worker(model_path: str, num_threads: int):
+    global _worker_model
+    configure_native_threads(num_threads)
+    _worker_model = build_backend(model_path, threads=num_threads)
+    _worker_model.warmup()
+
+def _worker_predict(images):
+    return _worker_model.predict(images)
+
+def _worker_detect_tiled(detector, image):
+    return detector.detect(image, _worker_predict)
+
+class InferenceExecutor:
+    """
+    Dedicated pools for CPU-bound work (image decode, YOLO, health scoring)
+    so the asyncio event loop only ever awaits. Admission is bounded: once
+    `max_pending` analyses are in flight, `admit()` raises ExecutorSaturated.
+    """
+
+    def __init__(self, pool=INFERENCE_POOL, threads=INFERENCE_THREADS,
+                 processes=INFERENCE_PROCESSES, max_pending=INFERENCE_MAX_PENDING):
+        self.threads = max(1, threads)
+        self.max_pending = max(1, max_pending)
+        self.uses_processes = pool == "process"
+        self.processes = max(1, processes)
+        self.native_threads = max(1, CPU_COUNT // self.threads)
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+        self._thread_pool = None
+        self._process_pool = None
+
+    def _threads_executor(self):
+        if self._thread_pool is None:
+            # Deferred to first use: importing cv2 / torch here would slow down app import
+            configure_native_threads(self.native_threads)
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="inference")
+        return self._thread_pool
+
+    def start_process_pool(self, model_path: str):
+        """Spawns worker processes that each load `model_path` once."""
+        if not self.uses_processes or self._process_pool is not None:
+            return
+        if multiprocessing.current_process().name != "MainProcess":
+            # Spawned workers re-import the app; they must not start pools of their own
+            return
+        native = max(1, CPU_COUNT // self.processes)
+        self._process_pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_path, native),
+        )
+        logger.info(f"Inference process pool started: {self.processes} workers x {native} threads")
+
+    @contextmanager
+    def admit(self):
+        """Reserves one admission slot for the duration of an analysis."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise ExecutorSaturated(f"{self._pending} analyses already in flight")
+            self._pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def run(self, fn, *args):
+        """Runs a blocking callable on the inference thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._threads_executor(), fn, *args)
+
+    async def predict(self, local_predict_fn, images):
+        """
+        Runs a batched forward pass: on the process pool when enabled,
+        otherwise `local_predict_fn` on the thread pool.
+        """
+        if self._process_pool is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._process_pool, _worker_predict, images)
+        return await self.run(local_predict_fn, images)
+
+    async def detect_tiled(self, detector, local_predict_fn, image):
+        """Runs a SlicedDetector over `image`, in a worker process when the process pool is enabled."""
+        if self._process_pool is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._process_pool, _worker_detect_tiled, detector, image)
+        return await self.run(detector.detect, image, local_predict_fn)
+
+    def stats(self):
+        return {
+            "pool": "process" if self._process_pool is not None else "thread",
+            "threads": self.threads,
+            "native_threads": self.native_threads,
+            "processes": self.processes if self._process_pool is not None else 0,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+inference_executor = InferenceExecutor()
@@ -0,0 +1,213 @@
+import os
+import uuid
+import asyncio
+import hashlib
+from collections import Counter
+
+from fastapi.responses import JSONResponse
+
+# Uploads are stored content-addressed: <UPLOAD_DIR>/<sha256[:2]>/<sha256><ext>
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "temp")
+# 0 = remove stored uploads once analysed (and no queued job still needs them)
+PERSIST_UPLOADS = os.getenv("PERSIST_UPLOADS", "1") == "1"
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", "200"))
+UPLOAD_MAX_BYTES = int(UPLOAD_MAX_MB * 1024 * 1024)
+# Bytes copied (and hashed) per write; peak memory per upload stays around one chunk
+UPLOAD_CHUNK_KB = int(os.getenv("UPLOAD_CHUNK_KB", "1024"))
+# Single uploads up to this size also keep their bytes in memory, so analysis decodes them without re-reading the file
+UPLOAD_INLINE_MB = float(os.getenv("UPLOAD_INLINE_MB", "32"))
+UPLOAD_INLINE_BYTES = int(UPLOAD_INLINE_MB * 1024 * 1024)
+# Slack on top of UPLOAD_MAX_BYTES for multipart boundaries and form fields
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp", ".bmp"}
+
+class UploadTooLarge(Exception):
+    pass
+
+# Stored path -> in-flight users (uploads, batch images, job submissions) of this process
+_holders = Counter()
+# Paths to remove once their last holder releases them
+_discard = set()
+
+def release_upload(path: str, discard: bool = False, keep: bool = False) -> bool:
+    """
+    Drops one hold taken by ingest_chunks. With discard, the file is removed
+    as soon as no other in-flight request holds the same content (the last
+    holder removes it); keep cancels a pending discard because the file is now
+    referenced elsewhere (e.g. a queued job). Returns True if the file was removed.
+    """
+    _holders[path] -= 1
+    if keep:
+        _discard.discard(path)
+    elif discard:
+        _discard.add(path)
+    if _holders[path] > 0:
+        return False
+    del _holders[path]
+    if path not in _discard:
+        return False
+    _discard.discard(path)
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+def content_path(digest: str, filename: str = None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext not in IMAGE_EXTENSIONS:
+        ext = ".bin"
+    return os.path.join(UPLOAD_DIR, digest[:2], digest + ext)
+
+def _write_chunk(f, hasher, chunk):
+    hasher.update(chunk)
+    f.write(chunk)
+
+def discard_upload(path: str) -> bool:
+    """
+    Removes a stored file that no in-flight request holds; if one still does,
+    its last release_upload() removes it instead. Returns True if removed now.
+    """
+    if _holders.get(path, 0) > 0:
+        _discard.add(path)
+        return False
+    _discard.discard(path)
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+async def _rechunk(chunks, size: int):
+    """Coalesces small body messages into `size`-byte writes (one thread hop per chunk, not per message)."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+async def ingest_chunks(chunks, filename: str = None, max_bytes: int = UPLOAD_MAX_BYTES,
+                        chunk_size: int = UPLOAD_CHUNK_KB * 1024, keep_bytes: int = 0):
+    """
+    Streams an async iterator of bytes to disk while hashing it, then moves the
+    file to its content-addressed path. Raises UploadTooLarge as soon as the
+    running size passes max_bytes (the partial file is removed).
+
+    Returns {"path", "sha256", "size", "duplicate"}; duplicate means identical
+    content was already stored and the new copy was discarded. Uploads of at
+    most keep_bytes also return their content as "data". The stored path is
+    held until the caller calls release_upload().
+    """
+    partial_dir = os.path.join(UPLOAD_DIR, ".partial")
+    os.makedirs(partial_dir, exist_ok=True)
+    partial = os.path.join(partial_dir, uuid.uuid4().hex)
+    hasher = hashlib.sha256()
+    size = 0
+    kept = bytearray() if keep_bytes > 0 else None
+    try:
+        with open(partial, "wb") as f:
+            async for chunk in _rechunk(chunks, chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes / (1024 * 1024):g} MB")
+                if kept is not None:
+                    if size <= keep_bytes:
+                        kept += chunk
+                    else:
+                        kept = None
+                await asyncio.to_thread(_write_chunk, f, hasher, chunk)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    digest = hasher.hexdigest()
+    path = content_path(digest, filename)
+    duplicate = os.path.exists(path)
+    if duplicate:
+        os.remove(partial)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(partial, path)
+    # No await since the existence check: a concurrent release cannot remove the file in between
+    _holders[path] += 1
+    stored = {"path": path, "sha256": digest, "size": size, "duplicate": duplicate}
+    if kept is not None:
+        stored["data"] = bytes(kept)
+    return stored
+
+async def ingest_upload(file, max_bytes: int = UPLOAD_MAX_BYTES, chunk_size: int = UPLOAD_CHUNK_KB * 1024,
+                        keep_bytes: int = 0):
+    """Copies a multipart UploadFile (already spooled by the form parser) in fixed-size chunks."""
+    async def chunks():
+        while chunk := await file.read(chunk_size):
+            yield chunk
+    return await ingest_chunks(chunks(), file.filename, max_bytes, chunk_size, keep_bytes)
+
+async def ingest_request(request, filename: str = None, max_bytes: int = UPLOAD_MAX_BYTES,
+                         chunk_size: int = UPLOAD_CHUNK_KB * 1024, keep_bytes: int = 0):
+    """Copies a raw request body straight from the socket, never holding more than one chunk (plus keep_bytes)."""
+    return await ingest_chunks(request.stream(), filename, max_bytes, chunk_size, keep_bytes)
+
+class UploadSizeLimit:
+    """
+    ASGI middleware: rejects bodies over the limit of their upload path with
+    413, from Content-Length when present, otherwise as soon as the streamed
+    body passes the limit (before multipart parsing has spooled all of it).
+    `limits` maps path prefixes to MB; the longest matching prefix applies.
+    """
+
+    def __init__(self, app, limits=None):
+        self.app = app
+        limits = limits or {"/api/v1/scan/upload": UPLOAD_MAX_MB}
+        self.limits = sorted(((path, max_mb, int(max_mb * 1024 * 1024) + UPLOAD_FORM_OVERHEAD)
+                              for path, max_mb in limits.items()), key=lambda item: -len(item[0]))
+
+    def _limit(self, path: str):
+        for prefix, max_mb, max_bytes in self.limits:
+            if path.startswith(prefix):
+                return max_mb, max_bytes
+        return None
+
+    async def _reject(self, scope, receive, send, max_mb):
+        detail = f"Upload exceeds {max_mb:g} MB"
+        await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+        max_mb, max_bytes = limit
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            return await self._reject(scope, receive, send, max_mb)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge("request body too large")
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app answers after the limit tripped (e.g. a 400 parse error) is replaced by the 413
+            if not exceeded:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            pass
+        if exceeded:
+            await self._reject(scope, receive, send, max_mb)
@@ -0,0 +1,349 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+import crud
+import models
+from database import SessionLocal
+from services.ai_service import ai_service
+from services.metrics import StatSummary
+from services.inference_executor import ExecutorSaturated
+from services.alert_outbox import alert_dispatcher, enqueue_alert, ALERT_SMS_TO
+from services.ingest import discard_upload, PERSIST_UPLOADS
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Bulk jobs hold at most this many workers, so an interactive scan never waits behind a whole flight
+JOB_BULK_WORKERS = int(os.getenv("JOB_BULK_WORKERS", str(max(1, JOB_WORKERS - 1))))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+
+# Lane -> priority (lower is claimed first)
+LANES = {"interactive": 0, "bulk": 1}
+FINAL_STATUSES = ("done", "failed")
+
+# One statement, so concurrent workers never claim the same row
+_CLAIM_SQL = text("""
+    UPDATE analysis_jobs
+    SET status = 'running', started_at = :now, attempts = attempts + 1
+    WHERE id = (
+        SELECT id FROM analysis_jobs
+        WHERE status = 'queued' AND priority <= :max_priority
+        ORDER BY priority, id
+        LIMIT 1
+    )
+    RETURNING id, lane, image_path, content_hash, user_name, location_lat, location_lon, attempts, created_at
+""")
+
+def submit_jobs(db: Session, stored_files, user_name: str, lane: str = "interactive",
+                lat: float = None, lon: float = None):
+    """
+    Queues one analysis job per stored upload (ingest result dicts). An
+    upload's "gps" (lat, lon), when present, wins over the lat / lon fallback.
+    Returns the job ids in order.
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    if not stored_files:
+        return []
+    rows = []
+    for stored in stored_files:
+        location = stored.get("gps") or (lat, lon)
+        rows.append({
+            "lane": lane, "priority": LANES[lane], "status": "queued",
+            "image_path": stored["path"], "content_hash": stored["sha256"],
+            "user_name": user_name, "location_lat": location[0], "location_lon": location[1],
+        })
+    ids = db.execute(
+        insert(models.AnalysisJob).returning(models.AnalysisJob.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    db.commit()
+    job_runner.wake()
+    return ids
+
+def has_pending_jobs(image_path: str) -> bool:
+    """True while a queued or running job still needs the stored file."""
+    db = SessionLocal()
+    try:
+        return db.query(models.AnalysisJob.id).filter(
+            models.AnalysisJob.status.in_(("queued", "running")),
+            models.AnalysisJob.image_path == image_path,
+        ).first() is not None
+    finally:
+        db.close()
+
+def job_view(db: Session, job_id: int):
+    """Status (and result once done) of one job, or None."""
+    job = db.get(models.AnalysisJob, job_id)
+    if job is None:
+        return None
+    view = {
+        "job_id": job.id,
+        "status": job.status,
+        "lane": job.lane,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == "queued":
+        # Jobs claimed before this one: same or higher priority lane, older id
+        view["position"] = db.query(func.count(models.AnalysisJob.id)).filter(
+            models.AnalysisJob.status == "queued",
+            models.AnalysisJob.priority <= job.priority,
+            models.AnalysisJob.id < job.id,
+        ).scalar()
+    if job.status == "done":
+        view["scan_id"] = job.scan_id
+        view["result"] = job.result
+    if job.error:
+        view["error"] = job.error
+    return view
+
+def load_job_view(job_id: int):
+    db = SessionLocal()
+    try:
+        return job_view(db, job_id)
+    finally:
+        db.close()
+
+class JobRunner:
+    """
+    Local worker pool draining the durable analysis_jobs table. Jobs left
+    "running" by a crash are re-queued on start; interactive jobs are always
+    claimed before bulk ones, and bulk jobs never occupy every worker.
+    Failures are retried until JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, bulk_workers=JOB_BULK_WORKERS):
+        self.workers = max(1, workers)
+        self.bulk_workers = max(1, min(bulk_workers, self.workers))
+        self._tasks = []
+        self._wake = None
+        self._loop = None
+        self._running_bulk = 0
+        self._watchers = {}  # job id -> set of asyncio.Event
+        self.counters = {"completed": 0, "failed": 0, "retried": 0, "resumed": 0}
+        self.wait_ms = StatSummary()
+        self.run_ms = StatSummary()
+
+    # --- Lifecycle ---
+    async def start(self):
+        if self._tasks:
+            return
+        resumed = await asyncio.to_thread(self._requeue_stuck)
+        self.counters["resumed"] += resumed
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Job runner started ({self.workers} workers, {self.bulk_workers} for bulk, "
+                    f"{resumed} jobs resumed)")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def wake(self):
+        # Callable from worker threads too (submit_jobs runs off the event loop)
+        if self._wake is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._wake.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    # --- Subscriptions (SSE) ---
+    def subscribe(self, job_id: int) -> asyncio.Event:
+        event = asyncio.Event()
+        self._watchers.setdefault(job_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, job_id: int, event: asyncio.Event):
+        watchers = self._watchers.get(job_id)
+        if watchers is not None:
+            watchers.discard(event)
+            if not watchers:
+                del self._watchers[job_id]
+
+    def _notify(self, job_id: int):
+        for event in self._watchers.get(job_id, ()):
+            event.set()
+
+    # --- DB steps (run in threads) ---
+    def _requeue_stuck(self):
+        db = SessionLocal()
+        try:
+            count = db.query(models.AnalysisJob).filter(models.AnalysisJob.status == "running") \
+                .update({"status": "queued"}, synchronize_session=False)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def _claim(self, allow_bulk: bool):
+        max_priority = LANES["bulk"] if allow_bulk else LANES["interactive"]
+        db = SessionLocal()
+        try:
+            row = db.execute(_CLAIM_SQL, {"now": datetime.utcnow(), "max_priority": max_priority}).mappings().first()
+            db.commit()
+            return dict(row) if row else None
+        finally:
+            db.close()
+
+    def _complete(self, job, result):
+        """Stores the scan, queues its alert and marks the job done in one transaction."""
+        db = SessionLocal()
+        try:
+            scan_create, result_create = crud.records_from_analysis(
+                result, job["image_path"], job["user_name"], job["location_lat"], job["location_lon"])
+            db_scan = crud.create_scan_entry(db, scan_create, result_create, commit=False)
+            pest_count = int(result.get("pest_count", 0))
+            alert = None
+            if ALERT_SMS_TO and pest_count > 0:
+                alert = enqueue_alert(
+                    db, ALERT_SMS_TO,
+                    f"AgriScan alert: {pest_count} pests detected in {job['user_name']}'s field. Apply pesticide.",
+                    dedup_key=f"field:{scan_create.location_lat:.3f}:{scan_create.location_lon:.3f}"
+                    if scan_create.location_lat is not None else None,
+                    commit=False
+                )
+            db.flush()
+            result["db_id"] = db_scan.id
+            record = db.get(models.AnalysisJob, job["id"])
+            record.status, record.scan_id, record.result = "done", db_scan.id, result
+            record.finished_at, record.error = datetime.utcnow(), None
+            db.commit()
+            return alert is not None
+        finally:
+            db.close()
+
+    def _release(self, job_id: int, error: str, count_attempt: bool = True):
+        """Puts a job back in the queue, or fails it once it is out of attempts. Returns the new status."""
+        db = SessionLocal()
+        try:
+            record = db.get(models.AnalysisJob, job_id)
+            if not count_attempt:
+                record.attempts -= 1
+            final = count_attempt and record.attempts >= JOB_MAX_ATTEMPTS
+            record.status = "failed" if final else "queued"
+            record.error = error
+            if final:
+                record.finished_at = datetime.utcnow()
+            db.commit()
+            return record.status
+        finally:
+            db.close()
+
+    # --- Workers ---
+    async def _worker(self):
+        while True:
+            # Reserve a bulk slot before claiming, so concurrent workers cannot overshoot the cap
+            allow_bulk = self._running_bulk < self.bulk_workers
+            if allow_bulk:
+                self._running_bulk += 1
+            job = None
+            try:
+                job = await asyncio.to_thread(self._claim, allow_bulk)
+            except Exception as e:
+                logger.error(f"Job queue poll failed: {e}")
+            finally:
+                if allow_bulk and (job is None or job["lane"] != "bulk"):
+                    self._running_bulk -= 1
+
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._execute(job)
+            except Exception as e:
+                # A failed DB step must not take the worker down; the job is re-queued on restart
+                logger.error(f"Job {job['id']} could not be settled: {e}")
+            finally:
+                if job["lane"] == "bulk":
+                    self._running_bulk -= 1
+
+    async def _execute(self, job):
+        self._notify(job["id"])
+        created_at = job["created_at"]
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        self.wait_ms.observe((datetime.utcnow() - created_at).total_seconds() * 1000)
+        started = asyncio.get_running_loop().time()
+        try:
+            result = await ai_service.analyze_image(job["image_path"], user_name=job["user_name"],
+                                                    content_hash=job["content_hash"],
+                                                    lat=job["location_lat"], lon=job["location_lon"])
+            alert_queued = await asyncio.to_thread(self._complete, job, result)
+            if alert_queued:
+                alert_dispatcher.wake()
+            self.counters["completed"] += 1
+            self.run_ms.observe((asyncio.get_running_loop().time() - started) * 1000)
+            status = "done"
+        except ExecutorSaturated:
+            # Not the job's fault: hand it back without spending an attempt
+            status = await asyncio.to_thread(self._release, job["id"], None, False)
+            await asyncio.sleep(0.5)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed (attempt {job['attempts']}): {e}")
+            status = await asyncio.to_thread(self._release, job["id"], str(e))
+            self.counters["failed" if status == "failed" else "retried"] += 1
+        self._notify(job["id"])
+        if status in FINAL_STATUSES and not PERSIST_UPLOADS:
+            await self._discard_upload(job["image_path"])
+
+    async def _discard_upload(self, path: str):
+        # The upload was kept for its jobs; drop it once the last one has settled
+        try:
+            if not await asyncio.to_thread(has_pending_jobs, path):
+                discard_upload(path)
+        except Exception as e:
+            logger.warning(f"Could not discard upload {path}: {e}")
+
+    def stats(self):
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(models.AnalysisJob.lane, models.AnalysisJob.status,
+                       func.count(models.AnalysisJob.id), func.min(models.AnalysisJob.created_at))
+                .where(models.AnalysisJob.status.in_(("queued", "running")))
+                .group_by(models.AnalysisJob.lane, models.AnalysisJob.status)
+            ).all()
+        finally:
+            db.close()
+        lanes = {lane: {"queued": 0, "running": 0, "oldest_queued_age_s": None} for lane in LANES}
+        for lane, status, count, oldest in rows:
+            entry = lanes.setdefault(lane, {"queued": 0, "running": 0, "oldest_queued_age_s": None})
+            entry[status] = count
+            if status == "queued" and oldest is not None:
+                entry["oldest_queued_age_s"] = round((now - oldest).total_seconds(), 3)
+        return {
+            "workers": self.workers,
+            "bulk_workers": self.bulk_workers,
+            "running": len(self._tasks) > 0 and not all(t.done() for t in self._tasks),
+            "lanes": lanes,
+            "wait_ms": self.wait_ms.snapshot(),
+            "run_ms": self.run_ms.snapshot(),
+            **self.counters,
+        }
+
+job_runner = JobRunner()
@@ -0,0 +1,70 @@
+import time
+import threading
+from collections import deque
+
+class StatSummary:
+    """
+    Thread-safe running summary of one measured quantity
+    (count / mean / min / max plus p50 / p95 over the most recent samples).
+    """
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        value = float(value)
+        with self._lock:
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+            self._recent.append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, total = self.count, self.total
+            lo, hi = self.min, self.max
+
+        def pct(p):
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 3)
+
+        return {
+            "count": count,
+            "mean": round(total / count, 3) if count else None,
+            "min": round(lo, 3) if lo is not None else None,
+            "max": round(hi, 3) if hi is not None else None,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+        }
+
+class RateMeter:
+    """Thread-safe events-per-second over a sliding time window."""
+
+    def __init__(self, window_s: float = 2.0):
+        self._lock = threading.Lock()
+        self._times = deque()
+        self.window = window_s
+        self.count = 0
+
+    def mark(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.count += 1
+            self._times.append(now)
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            while self._times and now - self._times[0] > self.window:
+                self._times.popleft()
+            return round(len(self._times) / self.window, 2)
@@ -1,18 +1,45 @@
-import cv2
+import os
 import numpy as np
 import logging
+from services.image_io import load_image
+from services.vegetation_index import vegetation_engine
 
 logger = logging.getLogger(__name__)
 
-def calculate_health_index(image_path: str) -> float:
+# "hsv" keeps the original green-pixel ratio; "vegetation" scores from the multi-index engine
+HEALTH_INDEX_METHOD = os.getenv("HEALTH_INDEX_METHOD", "hsv").lower()
+# 1 = report vegetation_indices with every scan even when scoring from HSV (a full index pass per image)
+VEGETATION_INDICES = os.getenv("VEGETATION_INDICES", "0") == "1"
+
+def needs_vegetation(method: str = None) -> bool:
+    """True when an analysis has to run the vegetation index engine."""
+    return (method or HEALTH_INDEX_METHOD) == "vegetation" or VEGETATION_INDICES
+
+def health_from_indices(vegetation: dict) -> float:
+    """
+    Scores health from a VegetationIndexEngine result: vegetation cover from
+    NDVI when a NIR band was present, otherwise from ExG. Same scale as the
+    HSV score (50% cover = 100) but kept as a float.
+    """
+    indices = vegetation["indices"]
+    source = indices["ndvi"] if "ndvi" in indices else indices["exg"]
+    return round(min(100.0, source["vegetation_fraction"] / 0.5 * 100), 1)
+
+def calculate_health_index(image, method: str = None, vegetation: dict = None) -> float:
     """
     Implements the Plant Health Monitoring logic (NDVI-like Green Index).
     Source reference: https://github.com/CodeByPinar/Plant-Health-Monitoring
+    Accepts an already-decoded BGR ndarray (preferred) or an image path.
+    A precomputed `vegetation` result is reused instead of recomputing indices.
     """
+    import cv2  # deferred: keeps app import fast
     try:
-        img = cv2.imread(image_path)
+        img = load_image(image)
         if img is None:
             raise ValueError("Image not found")
+
+        if (method or HEALTH_INDEX_METHOD) == "vegetation":
+            return health_from_indices(vegetation or vegetation_engine.compute(img, with_grids=False))
             
         # Convert to HSV (Hue, Saturation, Value)
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
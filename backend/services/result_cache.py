@@ -0,0 +1,165 @@
+import os
+import copy
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from sqlalchemy import or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+from database import SessionLocal
+from services import tiling, inference_backends, plant_health, field_map
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1") == "1"
+# Entries kept in the in-process LRU tier (the DB tier is unbounded, pruned on version change)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+# Bump by hand for rule changes that live outside the fingerprinted sources below
+ANALYSIS_RULES_VERSION = os.getenv("ANALYSIS_RULES_VERSION", "1")
+
+SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+# Modules whose code decides the analysis output; editing any of them changes RULES_VERSION
+RULE_SOURCES = ("ai_service.py", "scoring.py", "farmvibes_yield.py", "plant_health.py",
+                "vegetation_index.py", "tiling.py", "inference_backends.py")
+
+def file_fingerprint(path: str) -> str:
+    """sha256 of a file, or of every file in a directory (exported OpenVINO models); the path itself if missing."""
+    if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        return os.path.basename(path)
+    hasher = hashlib.sha256()
+    for name in files:
+        with open(name, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hasher.update(chunk)
+    return hasher.hexdigest()[:16]
+
+def rules_fingerprint() -> str:
+    """Hash of the rule sources plus the thresholds that are configured through the environment."""
+    hasher = hashlib.sha256(ANALYSIS_RULES_VERSION.encode())
+    for name in RULE_SOURCES:
+        with open(os.path.join(SERVICES_DIR, name), "rb") as f:
+            hasher.update(f.read())
+    settings = (
+        inference_backends.INFERENCE_IMGSZ, inference_backends.INFERENCE_CONF, inference_backends.INFERENCE_IOU,
+        tiling.INFERENCE_TILED, tiling.INFERENCE_TILE_SIZE, tiling.INFERENCE_TILE_OVERLAP,
+        tiling.INFERENCE_TILE_MIN_SIDE, tiling.INFERENCE_TILE_NMS_IOU, plant_health.HEALTH_INDEX_METHOD,
+        plant_health.VEGETATION_INDICES,
+        # The field grid names the zone in the action plan
+        field_map.DEFAULT_FIELD_LAT, field_map.DEFAULT_FIELD_LON, field_map.FIELD_CELL_M, field_map.FIELD_ZONE_CELLS,
+    )
+    hasher.update(repr(settings).encode())
+    return hasher.hexdigest()[:16]
+
+RULES_VERSION = rules_fingerprint()
+
+class ResultCache:
+    """
+    Analysis results keyed by (image sha256, model version, rules version).
+    Lookups try the in-process LRU first, then the analysis_cache table; results
+    are deep-copied in and out so callers can decorate them freely.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, rules_version: str = RULES_VERSION):
+        self.max_entries = max(0, max_entries)
+        self.rules_version = rules_version
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "purged": 0}
+
+    def _remember(self, key, result):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._memory[key] = result
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, content_hash, model_version):
+        db = SessionLocal()
+        try:
+            entry = db.get(models.AnalysisCacheEntry, (content_hash, model_version, self.rules_version))
+            return entry.result if entry else None
+        finally:
+            db.close()
+
+    def _store(self, content_hash, model_version, result):
+        stmt = sqlite_insert(models.AnalysisCacheEntry).values(
+            content_hash=content_hash, model_version=model_version,
+            rules_version=self.rules_version, result=result,
+        ).on_conflict_do_nothing(index_elements=["content_hash", "model_version", "rules_version"])
+        db = SessionLocal()
+        try:
+            db.execute(stmt)
+            db.commit()
+        finally:
+            db.close()
+
+    async def get(self, content_hash: str, model_version: str):
+        """Returns a private copy of the cached result, or None."""
+        key = (content_hash, model_version)
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+        if result is not None:
+            self.counters["memory_hits"] += 1
+            return copy.deepcopy(result)
+        try:
+            result = await asyncio.to_thread(self._load, content_hash, model_version)
+        except Exception as e:
+            logger.error(f"Result cache lookup failed: {e}")
+            result = None
+        if result is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["db_hits"] += 1
+        self._remember(key, result)
+        return copy.deepcopy(result)
+
+    async def put(self, content_hash: str, model_version: str, result: dict):
+        result = copy.deepcopy(result)
+        self._remember((content_hash, model_version), result)
+        try:
+            await asyncio.to_thread(self._store, content_hash, model_version, result)
+            self.counters["stores"] += 1
+        except Exception as e:
+            logger.error(f"Result cache store failed: {e}")
+
+    def purge_stale(self, model_version: str) -> int:
+        """Drops entries from any other model or rules version (run after a model load)."""
+        with self._lock:
+            self._memory.clear()
+        db = SessionLocal()
+        try:
+            deleted = db.query(models.AnalysisCacheEntry).filter(or_(
+                models.AnalysisCacheEntry.model_version != model_version,
+                models.AnalysisCacheEntry.rules_version != self.rules_version,
+            )).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        if deleted:
+            self.counters["purged"] += deleted
+            logger.info(f"Result cache: purged {deleted} entries from older model/rules versions")
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            size = len(self._memory)
+        return {
+            "enabled": RESULT_CACHE_ENABLED,
+            "rules_version": self.rules_version,
+            "memory_entries": size,
+            "memory_capacity": self.max_entries,
+            **self.counters,
+        }
+
+result_cache = ResultCache()
@@ -0,0 +1,212 @@
+import os
+import re
+import logging
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+
+logger = logging.getLogger(__name__)
+
+# A scan with at least this many pests counts as an alert (same trigger as the SMS outbox)
+ROLLUP_ALERT_MIN_PESTS = int(os.getenv("ROLLUP_ALERT_MIN_PESTS", "1"))
+# "Active" alerts on the dashboard = alerts raised in the last N days
+ROLLUP_ACTIVE_DAYS = int(os.getenv("ROLLUP_ACTIVE_DAYS", "7"))
+
+_NUMBER = re.compile(r"[-+]?\d*\.?\d+")
+
+def parse_yield(value):
+    """"4.2 Tons/Hectare" -> 4.2; None for "N/A", "Unknown" or missing."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER.search(str(value))
+    return float(match.group()) if match else None
+
+def field_key(lat, lon):
+    # Same rounding as the alert dedup key ("field:20.296:85.824")
+    return f"{lat:.3f}:{lon:.3f}"
+
+def _scope_keys(timestamp, user_name, lat, lon):
+    day = timestamp.date().isoformat()
+    keys = [("all", "all"), ("day", day)]
+    if user_name:
+        keys += [("user", user_name), ("user_day", f"{user_name}|{day}")]
+    if lat is not None and lon is not None:
+        keys.append(("field", field_key(lat, lon)))
+    return keys
+
+def _empty(scope, key):
+    return {
+        "scope": scope, "key": key, "scan_count": 0,
+        "health_count": 0, "health_sum": 0.0, "health_min": None, "health_max": None,
+        "pest_total": 0, "alert_count": 0,
+        "yield_count": 0, "yield_sum": 0.0, "yield_min": None, "yield_max": None,
+    }
+
+def _merge_min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _merge_max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+def accumulate(deltas: dict, timestamp, user_name, lat, lon, health, pests, yield_prediction):
+    """Folds one scan into the in-memory `deltas` dict keyed by (scope, key)."""
+    yield_value = parse_yield(yield_prediction)
+    pests = pests or 0
+    for scope_key in _scope_keys(timestamp, user_name, lat, lon):
+        d = deltas.get(scope_key)
+        if d is None:
+            d = deltas[scope_key] = _empty(*scope_key)
+        d["scan_count"] += 1
+        if health is not None:
+            d["health_count"] += 1
+            d["health_sum"] += health
+            d["health_min"] = _merge_min(d["health_min"], health)
+            d["health_max"] = _merge_max(d["health_max"], health)
+        d["pest_total"] += pests
+        d["alert_count"] += int(pests >= ROLLUP_ALERT_MIN_PESTS)
+        if yield_value is not None:
+            d["yield_count"] += 1
+            d["yield_sum"] += yield_value
+            d["yield_min"] = _merge_min(d["yield_min"], yield_value)
+            d["yield_max"] = _merge_max(d["yield_max"], yield_value)
+
+def _least(current, new):
+    # SQLite's scalar min() returns NULL if any argument is NULL
+    return func.min(func.coalesce(current, new), func.coalesce(new, current))
+
+def _greatest(current, new):
+    return func.max(func.coalesce(current, new), func.coalesce(new, current))
+
+def _upsert_statement():
+    stmt = sqlite_insert(models.ScanRollup)
+    t, ex = models.ScanRollup.__table__.c, stmt.excluded
+    return stmt.on_conflict_do_update(index_elements=["scope", "key"], set_={
+        "scan_count": t.scan_count + ex.scan_count,
+        "health_count": t.health_count + ex.health_count,
+        "health_sum": t.health_sum + ex.health_sum,
+        "health_min": _least(t.health_min, ex.health_min),
+        "health_max": _greatest(t.health_max, ex.health_max),
+        "pest_total": t.pest_total + ex.pest_total,
+        "alert_count": t.alert_count + ex.alert_count,
+        "yield_count": t.yield_count + ex.yield_count,
+        "yield_sum": t.yield_sum + ex.yield_sum,
+        "yield_min": _least(t.yield_min, ex.yield_min),
+        "yield_max": _greatest(t.yield_max, ex.yield_max),
+        "updated_at": ex.updated_at,
+    })
+
+# Built once: constructing the upsert per scan costs more than executing it
+_UPSERT = _upsert_statement()
+
+def apply(db: Session, deltas: dict):
+    """Upserts the deltas in one executemany statement; the caller commits."""
+    if not deltas:
+        return
+    now = datetime.utcnow()
+    db.execute(_UPSERT, [{**d, "updated_at": now} for d in deltas.values()])
+
+def record_scans(db: Session, rows):
+    """
+    Adds scans to the rollups inside the caller's transaction.
+    rows: iterable of (timestamp, user_name, lat, lon, health, pests, yield) where yield is
+    a number or a display string such as "4.2 Tons/Hectare"
+    """
+    deltas = {}
+    for row in rows:
+        accumulate(deltas, *row)
+    apply(db, deltas)
+
+def rebuild(db: Session, chunk: int = 5000) -> int:
+    """Recomputes every rollup from scans/scan_results (backfills, repairs). Returns scans read."""
+    query = select(
+        models.Scan.timestamp, models.Scan.user_name, models.Scan.location_lat, models.Scan.location_lon,
+        models.ScanResult.health_score, models.ScanResult.pest_detected_count,
+        func.coalesce(models.ScanResult.yield_value, models.ScanResult.yield_prediction),
+    ).outerjoin(models.ScanResult, models.ScanResult.scan_id == models.Scan.id)
+
+    deltas, count = {}, 0
+    # Streams the history; memory is bounded by the number of rollup keys, not scans
+    for row in db.execute(query.execution_options(yield_per=chunk)):
+        accumulate(deltas, *row)
+        count += 1
+
+    db.execute(delete(models.ScanRollup))
+    apply(db, deltas)
+    db.commit()
+    logger.info(f"Rollups rebuilt from {count} scans ({len(deltas)} keys)")
+    return count
+
+def _summary(row):
+    if row is None:
+        return None
+    return {
+        "scan_count": row.scan_count,
+        "health": {
+            "mean": round(row.health_sum / row.health_count, 2) if row.health_count else None,
+            "min": row.health_min,
+            "max": row.health_max,
+        },
+        "pest_total": row.pest_total,
+        "alert_count": row.alert_count,
+        "yield": {
+            "mean": round(row.yield_sum / row.yield_count, 2) if row.yield_count else None,
+            "min": row.yield_min,
+            "max": row.yield_max,
+        },
+    }
+
+def get_rollup(db: Session, scope: str, key: str):
+    return _summary(db.get(models.ScanRollup, (scope, key)))
+
+def dashboard_stats(db: Session, user_name: str = None):
+    """
+    Dashboard totals from the rollups: one primary-key read plus a range read
+    over at most ROLLUP_ACTIVE_DAYS day rows, independent of the number of scans.
+    """
+    scope, key = ("user", user_name) if user_name else ("all", "all")
+    total = get_rollup(db, scope, key) or _summary(models.ScanRollup(**_empty(scope, key)))
+
+    since = (datetime.utcnow().date() - timedelta(days=ROLLUP_ACTIVE_DAYS - 1)).isoformat()
+    day_scope, low, high = ("user_day", f"{user_name}|{since}", f"{user_name}|~") if user_name \
+        else ("day", since, "~")
+    active_alerts = db.query(func.coalesce(func.sum(models.ScanRollup.alert_count), 0)).filter(
+        models.ScanRollup.scope == day_scope,
+        models.ScanRollup.key >= low,
+        models.ScanRollup.key <= high,
+    ).scalar()
+
+    mean_yield = total["yield"]["mean"]
+    return {
+        "total_scans": total["scan_count"],
+        "active_alerts": int(active_alerts),
+        "projected_yield": f"{mean_yield:.1f} T/Ha" if mean_yield is not None else "N/A",
+        "health": total["health"],
+        "pest_total": total["pest_total"],
+        "yield": total["yield"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan rollup maintenance")
+    parser.add_argument("--rebuild", action="store_true", help="recompute all rollups from scan history")
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    from database import SessionLocal, engine
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        rebuild(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# Deterministic agronomy rules shared by live analysis (ai_service) and the
+# offline re-scoring job (rescore.py). No model imports, so workers load it cheaply.
+
+# Health scores below this are treated as a failed measurement, not a dead field
+MIN_CREDIBLE_HEALTH = 5
+FALLBACK_HEALTH = 65
+
+def sanitize_health(health_score: float) -> float:
+    return FALLBACK_HEALTH if health_score < MIN_CREDIBLE_HEALTH else health_score
+
+def npk_levels(health_score: float, pest_count: int, weather_desc: str, weather_humidity: float):
+    """Returns (n_level, p_level, k_level)."""
+    n_level, p_level, k_level = "Optimal", "Optimal", "Optimal"
+    # Rule 1: Nitrogen
+    if health_score < 75: n_level = "Low"
+    # Rule 2: Potassium
+    if "Rain" in (weather_desc or "") or (weather_humidity or 0) > 80: k_level = "Low"
+    # Rule 3: Phosphorus
+    if pest_count > 1: p_level = "Low"
+    return n_level, p_level, k_level
+
+NUTRIENT_ACTIONS = {
+    "n": "Nitrogen deficiency (Chlorosis): Apply Urea.",
+    "k": "Potassium leaching risk: Add Potash.",
+    "p": "Root stress detected: Apply Phosphate.",
+}
+
+def action_plan(user_name: str, n_level: str, p_level: str, k_level: str, pest_count: int, zone: str = None):
+    """Report header plus one recommendation per finding, addressed to the field zone when known."""
+    where = f"Zone {zone}: " if zone else ""
+    actions = [f"Report generated for {user_name}"]
+    for nutrient, level in (("n", n_level), ("k", k_level), ("p", p_level)):
+        if level == "Low": actions.append(where + NUTRIENT_ACTIONS[nutrient])
+    if pest_count > 0: actions.append(f"{where}Pests found ({pest_count}): Apply pesticide.")
+    if not actions: actions.append("Crop is healthy. Continue monitoring.")
+    return actions
+
+def scan_alerts(pest_count: int):
+    return ["Pests Detected" if pest_count > 0 else "Field Healthy"]
@@ -0,0 +1,113 @@
+import os
+import numpy as np
+
+# Sliced inference for high-resolution drone frames.
+# "auto" tiles only frames whose long side exceeds INFERENCE_TILE_MIN_SIDE.
+INFERENCE_TILED = os.getenv("INFERENCE_TILED", "auto").lower()
+INFERENCE_TILE_SIZE = int(os.getenv("INFERENCE_TILE_SIZE", "640"))
+INFERENCE_TILE_OVERLAP = float(os.getenv("INFERENCE_TILE_OVERLAP", "0.2"))
+INFERENCE_TILE_BATCH = int(os.getenv("INFERENCE_TILE_BATCH", "8"))
+INFERENCE_TILE_MIN_SIDE = int(os.getenv("INFERENCE_TILE_MIN_SIDE", str(2 * INFERENCE_TILE_SIZE)))
+INFERENCE_TILE_NMS_IOU = float(os.getenv("INFERENCE_TILE_NMS_IOU", "0.5"))
+
+def nms(boxes, scores, iou_threshold=0.5, metric="iou"):
+    """
+    Greedy non-maximum suppression.
+
+    Args:
+        boxes: (N, 4) array of x1, y1, x2, y2.
+        scores: (N,) confidences.
+        metric: "iou" (intersection over union) or "ios" (intersection over
+            the smaller box, better at merging boxes cut by a tile border).
+
+    Returns:
+        np.ndarray: indices of kept boxes, highest score first.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if boxes.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        ih = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = iw * ih
+        if metric == "ios":
+            overlap = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        else:
+            overlap = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+def _starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)  # last tile flush with the edge
+    return starts
+
+class SlicedDetector:
+    """
+    Runs a detector over overlapping tiles of a large frame and merges the
+    boxes back into full-image coordinates with cross-tile NMS.
+
+    Tiles are numpy views streamed through the model `batch_size` at a time,
+    so peak memory depends on the tile batch, not on the frame size.
+    Plain configuration only, so it pickles cleanly to worker processes.
+    """
+
+    def __init__(self, tile_size=INFERENCE_TILE_SIZE, overlap=INFERENCE_TILE_OVERLAP,
+                 batch_size=INFERENCE_TILE_BATCH, iou_threshold=INFERENCE_TILE_NMS_IOU,
+                 mode=INFERENCE_TILED, min_side=INFERENCE_TILE_MIN_SIDE):
+        self.tile_size = max(32, tile_size)
+        self.overlap = min(max(overlap, 0.0), 0.9)
+        self.batch_size = max(1, batch_size)
+        self.iou_threshold = iou_threshold
+        self.mode = mode
+        self.min_side = min_side
+
+    def should_tile(self, image):
+        if self.mode == "on":
+            return True
+        if self.mode == "auto":
+            return max(image.shape[:2]) > self.min_side
+        return False
+
+    def windows(self, height, width):
+        stride = max(1, int(self.tile_size * (1.0 - self.overlap)))
+        return [
+            (x0, y0, min(x0 + self.tile_size, width), min(y0 + self.tile_size, height))
+            for y0 in _starts(height, self.tile_size, stride)
+            for x0 in _starts(width, self.tile_size, stride)
+        ]
+
+    def detect(self, image, predict_fn):
+        """
+        Args:
+            image: full-resolution BGR frame.
+            predict_fn: list of tiles -> list of [(x1, y1, x2, y2, conf), ...] per tile.
+
+        Returns:
+            (boxes, tile_count): merged (x1, y1, x2, y2, conf) tuples in image pixels.
+        """
+        windows = self.windows(*image.shape[:2])
+        merged = []
+        for start in range(0, len(windows), self.batch_size):
+            chunk = windows[start:start + self.batch_size]
+            outputs = predict_fn([image[y0:y1, x0:x1] for x0, y0, x1, y1 in chunk])
+            for (x0, y0, _, _), tile_boxes in zip(chunk, outputs):
+                merged.extend((bx1 + x0, by1 + y0, bx2 + x0, by2 + y0, conf)
+                              for bx1, by1, bx2, by2, conf in tile_boxes)
+
+        if not merged:
+            return [], len(windows)
+        arr = np.asarray(merged, dtype=np.float32)
+        keep = nms(arr[:, :4], arr[:, 4], self.iou_threshold)
+        return [tuple(float(v) for v in merged[i]) for i in keep], len(windows)
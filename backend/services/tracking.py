@@ -0,0 +1,188 @@
+import os
+import itertools
+import numpy as np
+
+# Minimum IoU between a track's predicted box and a detection for them to match
+TRACK_IOU = float(os.getenv("TRACK_IOU", "0.3"))
+# Fallback gate when boxes no longer overlap (fast pans, new tracks without velocity):
+# centre distance up to this many box diagonals still matches, ranked below any IoU match
+TRACK_MAX_JUMP = float(os.getenv("TRACK_MAX_JUMP", "1.5"))
+# Keyframes a track may go unmatched before it is dropped
+TRACK_MAX_MISSES = int(os.getenv("TRACK_MAX_MISSES", "2"))
+# Keyframe hits before a track counts as a unique pest (filters one-off false positives)
+TRACK_MIN_HITS = int(os.getenv("TRACK_MIN_HITS", "2"))
+# Alpha-beta filter gains: position / velocity correction per keyframe
+TRACK_ALPHA = float(os.getenv("TRACK_ALPHA", "0.7"))
+TRACK_BETA = float(os.getenv("TRACK_BETA", "0.3"))
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) x1, y1, x2, y2 boxes."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    iw = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    ih = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = iw * ih
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+def match_scores(predicted, detected, iou_threshold=TRACK_IOU, max_jump=TRACK_MAX_JUMP):
+    """
+    Association score per (track, detection): the IoU where it clears the
+    threshold, else a score below the threshold that falls with centre distance
+    (0 beyond max_jump diagonals of the predicted box).
+    """
+    predicted = np.asarray(predicted, dtype=np.float64).reshape(-1, 4)
+    detected = np.asarray(detected, dtype=np.float64).reshape(-1, 4)
+    ious = iou_matrix(predicted, detected)
+    centres_p = (predicted[:, :2] + predicted[:, 2:]) / 2
+    centres_d = (detected[:, :2] + detected[:, 2:]) / 2
+    diag = np.hypot(predicted[:, 2] - predicted[:, 0], predicted[:, 3] - predicted[:, 1])
+    jump = np.linalg.norm(centres_p[:, None] - centres_d[None, :], axis=2) / np.maximum(diag[:, None], 1e-9)
+    fallback = np.clip(1 - jump / max_jump, 0, None) * iou_threshold
+    return np.where(ious >= iou_threshold, ious, np.minimum(fallback, iou_threshold * 0.999))
+
+class Track:
+    """One pest followed across frames with a constant-velocity (alpha-beta) box filter."""
+    __slots__ = ("id", "box", "velocity", "conf", "max_conf", "hits", "misses", "first_seen", "last_seen")
+
+    def __init__(self, track_id: int, box, conf: float, t: float):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float64)
+        self.velocity = np.zeros(4)  # px / s per coordinate
+        self.conf = self.max_conf = conf
+        self.hits = 1
+        self.misses = 0
+        self.first_seen = self.last_seen = t
+
+    def predict(self, t: float):
+        return self.box + self.velocity * (t - self.last_seen)
+
+    def correct(self, box, conf: float, t: float):
+        dt = t - self.last_seen
+        predicted = self.predict(t)
+        residual = np.asarray(box, dtype=np.float64) - predicted
+        self.box = predicted + TRACK_ALPHA * residual
+        if dt > 0:
+            self.velocity = self.velocity + (TRACK_BETA / dt) * residual
+        self.conf = conf
+        self.max_conf = max(self.max_conf, conf)
+        self.hits += 1
+        self.misses = 0
+        self.last_seen = t
+
+class PestTracker:
+    """
+    IoU tracker (with a centre-distance fallback) fed with detections on
+    keyframes; between keyframes it only predicts. Each track keeps a stable
+    ID, and a pest is counted once, when its track is first confirmed.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU, max_misses=TRACK_MAX_MISSES, min_hits=TRACK_MIN_HITS,
+                 max_jump=TRACK_MAX_JUMP):
+        self.iou_threshold = iou_threshold
+        self.max_jump = max_jump
+        self.max_misses = max_misses
+        self.min_hits = max(1, min_hits)
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.unique_count = 0
+        self.peak_visible = 0
+        self.max_conf = 0.0
+        self._confirmed_durations = []
+
+    def _confirm(self, track: Track):
+        if track.hits == self.min_hits:
+            self.unique_count += 1
+            self.max_conf = max(self.max_conf, track.max_conf)
+
+    def update(self, detections, t: float):
+        """Keyframe step: matches [(x1, y1, x2, y2, conf), ...] to tracks. Returns the visible boxes."""
+        dets = [d for d in detections if d[2] > d[0] and d[3] > d[1]]
+        matched_tracks, matched_dets = set(), set()
+        if self.tracks and dets:
+            predicted = np.array([tr.predict(t) for tr in self.tracks])
+            scores = match_scores(predicted, [d[:4] for d in dets], self.iou_threshold, self.max_jump)
+            # Greedy assignment, best score first
+            for flat in np.argsort(scores, axis=None)[::-1]:
+                ti, di = divmod(int(flat), len(dets))
+                if scores[ti, di] <= 0:
+                    break
+                if ti in matched_tracks or di in matched_dets:
+                    continue
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+                track = self.tracks[ti]
+                track.correct(dets[di][:4], float(dets[di][4]), t)
+                self._confirm(track)
+
+        survivors = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    if track.hits >= self.min_hits:
+                        self._confirmed_durations.append(track.last_seen - track.first_seen)
+                    continue
+            survivors.append(track)
+        for i, det in enumerate(dets):
+            if i not in matched_dets:
+                track = Track(next(self._ids), det[:4], float(det[4]), t)
+                self._confirm(track)
+                survivors.append(track)
+        self.tracks = survivors
+        return self.boxes(t)
+
+    def boxes(self, t: float):
+        """Visible tracks at time t as (x1, y1, x2, y2, conf, track_id)."""
+        visible = [tr for tr in self.tracks if tr.misses == 0]
+        self.peak_visible = max(self.peak_visible, len(visible))
+        return [(*map(float, tr.predict(t)), tr.conf, tr.id) for tr in visible]
+
+    def summary(self):
+        durations = self._confirmed_durations + [
+            tr.last_seen - tr.first_seen for tr in self.tracks if tr.hits >= self.min_hits]
+        return {
+            "unique_pests": self.unique_count,
+            "peak_visible": self.peak_visible,
+            "max_confidence": round(self.max_conf, 3) if self.unique_count else None,
+            "mean_track_s": round(float(np.mean(durations)), 3) if durations else None,
+        }
+
+class KeyframeTracker:
+    """
+    Wraps a per-frame detector: full detection every `interval` frames, tracker
+    prediction in between. Frames must arrive in order (one inference worker).
+    """
+
+    def __init__(self, detect_fn, interval: int, tracker: PestTracker = None):
+        self.detect_fn = detect_fn
+        self.interval = max(1, interval)
+        self.tracker = tracker or PestTracker()
+        self.frames = 0
+        self.keyframes = 0
+
+    def __call__(self, frame, t: float):
+        is_keyframe = self.frames % self.interval == 0
+        self.frames += 1
+        if not is_keyframe:
+            return self.tracker.boxes(t)
+        self.keyframes += 1
+        return self.tracker.update(self.detect_fn(frame), t)
+
+    def reset(self):
+        self.tracker.reset()
+        self.frames = 0
+        self.keyframes = 0
+
+    def stats(self):
+        return {
+            "keyframe_interval": self.interval,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "active_tracks": len(self.tracker.tracks),
+            **self.tracker.summary(),
+        }
@@ -0,0 +1,186 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# RGB indices are always computed; NDVI only when a NIR band is supplied
+RGB_INDICES = ("exg", "vari", "gli", "ngrdi")
+
+# Per-index value above which a pixel counts as vegetation (for cover fraction)
+VEGETATION_THRESHOLDS = {
+    "exg": 0.10,
+    "vari": 0.0,
+    "gli": 0.05,
+    "ngrdi": 0.0,
+    "ndvi": 0.30,
+}
+
+EPS = 1e-6
+
+class _IndexAccumulator:
+    """Streams per-strip values into global statistics and a per-tile mean grid."""
+
+    def __init__(self, name, grid_shape):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.vegetation = 0
+        self.tile_sums = np.zeros(grid_shape, dtype=np.float64)
+
+    def update(self, values, tile, tile_row0, col_starts):
+        rows, width = values.shape
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.vegetation += int(np.count_nonzero(values > VEGETATION_THRESHOLDS[self.name]))
+        flat = values.reshape(-1)
+        self.total_sq += float(np.dot(flat, flat))
+
+        # Column sums per tile row (reshape is a view; only the last strip can have a partial tile)
+        full = rows - rows % tile
+        row_sums = values[:full].reshape(-1, tile, width).sum(axis=1, dtype=np.float64)
+        if full < rows:
+            row_sums = np.vstack([row_sums, values[full:].sum(axis=0, dtype=np.float64)])
+        sums = np.add.reduceat(row_sums, col_starts, axis=1)
+        self.total += float(sums.sum())
+        self.tile_sums[tile_row0:tile_row0 + sums.shape[0]] += sums
+
+    def result(self, tile_counts, with_grid):
+        mean = self.total / self.count
+        variance = max(0.0, self.total_sq / self.count - mean * mean)
+        stats = {
+            "mean": round(mean, 4),
+            "std": round(float(np.sqrt(variance)), 4),
+            "min": round(self.min, 4),
+            "max": round(self.max, 4),
+            "vegetation_fraction": round(self.vegetation / self.count, 4),
+        }
+        if with_grid:
+            stats["grid"] = np.round(self.tile_sums / tile_counts, 4).tolist()
+        return stats
+
+def _safe_divide(num, den, out):
+    """
+    out = num / (den + EPS), in place. For integer-valued channels a zero
+    denominator with a zero numerator gives 0 instead of NaN, without the
+    cost of a masked divide.
+    """
+    np.add(den, EPS, out=den)
+    np.divide(num, den, out=out)
+
+class VegetationIndexEngine:
+    """
+    Vectorized multi-index vegetation engine.
+
+    Computes ExG, VARI, GLI, NGRDI (and NDVI when a NIR band is present) in
+    float32 over horizontal strips, so a 40+ MP orthomosaic never needs more
+    than `memory_budget_mb` of working buffers. Strip height is a multiple of
+    `tile_size`, so per-tile grids are accumulated without crossing strips.
+    """
+
+    def __init__(self, tile_size: int = 256, memory_budget_mb: int = 64):
+        self.tile_size = max(8, tile_size)
+        self.memory_budget = max(1, memory_budget_mb) * 1024 * 1024
+
+    def _strip_rows(self, width, buffers):
+        bytes_per_row = width * 4 * buffers
+        rows = self.memory_budget // bytes_per_row
+        return max(self.tile_size, (rows // self.tile_size) * self.tile_size)
+
+    def compute(self, image, nir=None, with_grids: bool = True) -> dict:
+        """
+        Args:
+            image: HxWx3 BGR (OpenCV order) or HxWx4 BGR+NIR array.
+            nir: optional HxW NIR band, overrides a 4th channel.
+            with_grids: include per-tile mean grids in the output.
+
+        Returns:
+            dict: {"indices": {name: stats}, "tile_size", "grid_shape", "has_nir"}
+        """
+        if image is None or image.ndim != 3 or image.shape[2] < 3:
+            raise ValueError("Expected an HxWx3 (BGR) or HxWx4 (BGR+NIR) image")
+
+        h, w = image.shape[:2]
+        if nir is None and image.shape[2] >= 4:
+            nir = image[:, :, 3]
+        names = RGB_INDICES + (("ndvi",) if nir is not None else ())
+
+        tile = self.tile_size
+        grid_shape = (-(-h // tile), -(-w // tile))
+        col_starts = np.arange(0, w, tile)
+
+        # Working set per row: B, G, R, (NIR), total, numerator, denominator, output,
+        # plus one slot of slack for the boolean threshold mask and reductions
+        n_buffers = 9 if nir is not None else 8
+        strip = min(h, self._strip_rows(w, n_buffers))
+        B, G, R, total, num, den, out = (np.empty((strip, w), dtype=np.float32) for _ in range(7))
+        N = np.empty((strip, w), dtype=np.float32) if nir is not None else None
+
+        acc = {name: _IndexAccumulator(name, grid_shape) for name in names}
+
+        for y0 in range(0, h, strip):
+            rows = min(strip, h - y0)
+            view = image[y0:y0 + rows]
+            b, g, r = B[:rows], G[:rows], R[:rows]
+            np.copyto(b, view[:, :, 0], casting="unsafe")
+            np.copyto(g, view[:, :, 1], casting="unsafe")
+            np.copyto(r, view[:, :, 2], casting="unsafe")
+            t, n, d, o = total[:rows], num[:rows], den[:rows], out[:rows]
+            tile_row0 = y0 // tile
+
+            def emit(name):
+                acc[name].update(o, tile, tile_row0, col_starts)
+
+            # Shared numerator for ExG / GLI: 2G - R - B
+            np.add(b, g, out=t)
+            np.add(t, r, out=t)
+            np.multiply(g, 2.0, out=n)
+            np.subtract(n, r, out=n)
+            np.subtract(n, b, out=n)
+
+            # GLI: (2G - R - B) / (2G + R + B)
+            np.add(t, g, out=d)
+            _safe_divide(n, d, o)
+            emit("gli")
+
+            # ExG on chromatic coordinates: (2G - R - B) / (R + G + B)
+            _safe_divide(n, t, o)
+            emit("exg")
+
+            # NGRDI: (G - R) / (G + R)
+            np.subtract(g, r, out=n)
+            np.add(g, r, out=d)
+            _safe_divide(n, d, o)
+            emit("ngrdi")
+
+            # VARI: (G - R) / (G + R - B), clipped to [-1, 1] (d already carries +EPS)
+            np.subtract(d, b, out=d)
+            _safe_divide(n, d, o)
+            np.clip(o, -1.0, 1.0, out=o)
+            emit("vari")
+
+            if N is not None:
+                nb = N[:rows]
+                np.copyto(nb, nir[y0:y0 + rows], casting="unsafe")
+                # NDVI: (NIR - R) / (NIR + R)
+                np.subtract(nb, r, out=n)
+                np.add(nb, r, out=d)
+                _safe_divide(n, d, o)
+                emit("ndvi")
+
+        # Pixel counts per tile (edge tiles may be partial)
+        tile_h = np.minimum(tile, h - np.arange(0, h, tile))
+        tile_w = np.minimum(tile, w - col_starts)
+        tile_counts = np.outer(tile_h, tile_w).astype(np.float64)
+
+        return {
+            "indices": {name: acc[name].result(tile_counts, with_grids) for name in names},
+            "tile_size": tile,
+            "grid_shape": list(grid_shape),
+            "has_nir": nir is not None,
+        }
+
+vegetation_engine = VegetationIndexEngine()
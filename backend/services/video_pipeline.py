@@ -0,0 +1,362 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+import models
+from database import SessionLocal
+from services.metrics import StatSummary, RateMeter
+from services.tracking import KeyframeTracker
+
+logger = logging.getLogger(__name__)
+
+VIDEO_TARGET_FPS = float(os.getenv("VIDEO_TARGET_FPS", "10"))
+# Frames older than this when they reach inference are dropped instead of processed
+VIDEO_MAX_LATENCY_MS = float(os.getenv("VIDEO_MAX_LATENCY_MS", "500"))
+VIDEO_QUEUE_SIZE = int(os.getenv("VIDEO_QUEUE_SIZE", "2"))
+VIDEO_INFERENCE_WORKERS = int(os.getenv("VIDEO_INFERENCE_WORKERS", "1"))
+VIDEO_JPEG_QUALITY = int(os.getenv("VIDEO_JPEG_QUALITY", "80"))
+# Full detection every N analysed frames, tracked boxes in between; 0 = detect every frame, no tracking
+VIDEO_KEYFRAME_INTERVAL = int(os.getenv("VIDEO_KEYFRAME_INTERVAL", "5"))
+# A pipeline with no viewers is stopped after this long
+VIDEO_IDLE_TIMEOUT_S = float(os.getenv("VIDEO_IDLE_TIMEOUT_S", "5"))
+# A source that yields no frame for this many reads in a row (backing off between them) is given up
+VIDEO_MAX_EMPTY_READS = int(os.getenv("VIDEO_MAX_EMPTY_READS", "20"))
+VIDEO_EMPTY_READ_BACKOFF_S = float(os.getenv("VIDEO_EMPTY_READ_BACKOFF_S", "0.1"))
+
+def _put_latest(q: queue.Queue, item) -> bool:
+    """Non-blocking put that evicts the oldest item when full. Returns True if something was dropped."""
+    dropped = False
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                q.get_nowait()
+                dropped = True
+            except queue.Empty:
+                pass
+
+def draw_boxes(frame, boxes):
+    """Boxes are (x1, y1, x2, y2, conf) or, when tracked, (x1, y1, x2, y2, conf, track_id)."""
+    import cv2
+    for box in boxes:
+        x1, y1, x2, y2, conf = box[:5]
+        label = f"#{box[5]} {conf:.2f}" if len(box) > 5 else f"{conf:.2f}"
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+        cv2.putText(frame, label, (int(x1), max(0, int(y1) - 4)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+    return frame
+
+class VideoPipeline:
+    """
+    One analysed video source, shared by every viewer of it:
+
+        capture thread -> frame queue -> inference worker(s) -> result queue -> encoder -> viewers
+
+    Queues are small and drop their oldest frame when full, capture is paced
+    to the current emit interval (skipped frames are grabbed, not decoded), and
+    the emit interval backs off when end-to-end latency exceeds the target, so
+    playback stays real-time under CPU load instead of drifting.
+
+    With tracking on, only keyframes reach the detector; each pass over the
+    source is one flight whose unique pest count is stored in flight_summaries.
+    """
+
+    def __init__(self, source: str, detect_fn, target_fps=VIDEO_TARGET_FPS, max_latency_ms=VIDEO_MAX_LATENCY_MS,
+                 queue_size=VIDEO_QUEUE_SIZE, workers=VIDEO_INFERENCE_WORKERS, jpeg_quality=VIDEO_JPEG_QUALITY,
+                 keyframe_interval=VIDEO_KEYFRAME_INTERVAL, user_name: str = None):
+        # detect_fn: BGR frame -> [(x1, y1, x2, y2, conf), ...]
+        self.source = source
+        self.detect_fn = detect_fn
+        self.user_name = user_name
+        self.target_fps = max(0.1, target_fps)
+        self.max_latency = max_latency_ms / 1000.0
+        self.workers = max(1, workers)
+        self.tracker = None
+        if keyframe_interval > 0:
+            self.tracker = KeyframeTracker(detect_fn, keyframe_interval)
+            self.workers = 1  # the tracker needs frames in order
+        self.flight_started_at = None
+        self.flights_recorded = 0
+        self.jpeg_quality = jpeg_quality
+        self.emit_interval = 1.0 / self.target_fps
+        self.frames = queue.Queue(maxsize=max(1, queue_size))
+        self.results = queue.Queue(maxsize=max(1, queue_size))
+        self._stop = threading.Event()
+        self._threads = []
+        self._viewers = {}  # asyncio.Event -> loop
+        self._viewers_lock = threading.Lock()
+        self._latest = (0, None)  # (seq, jpeg bytes)
+        self._published_seq = 0
+        self.idle_since = None
+        self.rates = {stage: RateMeter() for stage in ("capture", "inference", "encode")}
+        self.dropped = {"paced": 0, "queue_full": 0, "stale": 0, "out_of_order": 0}
+        self.latency_ms = StatSummary()
+        self.inference_ms = StatSummary()
+
+    # --- Lifecycle ---
+    def start(self):
+        stages = [self._capture] + [self._infer] * self.workers + [self._encode]
+        for i, stage in enumerate(stages):
+            t = threading.Thread(target=stage, name=f"video-{stage.__name__.strip('_')}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info(f"Video pipeline started for {self.source} ({self.workers} inference workers, "
+                    f"{self.target_fps} fps target)")
+
+    def stop(self, wait: bool = False):
+        """Signals every stage to exit (they poll with short timeouts); viewers are woken and end."""
+        self._stop.set()
+        self._notify()
+        if wait:
+            for t in self._threads:
+                t.join(timeout=2)
+        logger.info(f"Video pipeline stopped for {self.source}")
+
+    @property
+    def running(self):
+        return bool(self._threads) and not self._stop.is_set()
+
+    # --- Stages (threads) ---
+    def _capture(self):
+        import cv2
+        cap = cv2.VideoCapture(self.source)
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        frame_period = 1.0 / source_fps
+        seq = 0
+        flight = 1
+        pass_frames = 0  # frames grabbed since the source last (re)started
+        empty_reads = 0
+        rewound = False
+        next_frame_at = time.monotonic()
+        next_emit_at = next_frame_at
+        try:
+            while not self._stop.is_set() and cap.isOpened():
+                # Files are played back in real time; live sources pace themselves
+                delay = next_frame_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                next_frame_at += frame_period
+
+                if not cap.grab():
+                    empty_reads += 1
+                    if empty_reads > VIDEO_MAX_EMPTY_READS:
+                        logger.error(f"No frames from {self.source} after {VIDEO_MAX_EMPTY_READS} reads")
+                        break
+                    # Loop a file that played through; anything else (a stalled stream, an empty
+                    # file) backs off and is retried
+                    if pass_frames and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        rewound = True
+                    else:
+                        self._stop.wait(min(1.0, VIDEO_EMPTY_READ_BACKOFF_S * empty_reads))
+                        next_frame_at = next_emit_at = time.monotonic()
+                    pass_frames = 0
+                    continue
+                empty_reads = 0
+                if rewound:
+                    # The rewound source delivered again: this pass is a new flight
+                    flight += 1
+                    rewound = False
+                pass_frames += 1
+                now = time.monotonic()
+                if now < next_emit_at:
+                    self.dropped["paced"] += 1  # grabbed but never decoded
+                    continue
+                next_emit_at = max(next_emit_at + self.emit_interval, now)
+
+                ok, frame = cap.retrieve()
+                if not ok:
+                    continue
+                seq += 1
+                self.rates["capture"].mark(now)
+                if _put_latest(self.frames, (seq, now, flight, frame)):
+                    self.dropped["queue_full"] += 1
+        finally:
+            cap.release()
+            if not self._stop.is_set():
+                logger.error(f"Video source closed or unreadable: {self.source}")
+                self.stop()
+
+    def _infer(self):
+        current_flight = None
+        while not self._stop.is_set():
+            try:
+                seq, captured_at, flight, frame = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if time.monotonic() - captured_at > self.max_latency:
+                self.dropped["stale"] += 1
+                continue
+            if flight != current_flight:
+                self._finish_flight()
+                current_flight = flight
+                self.flight_started_at = datetime.utcnow()
+            started = time.perf_counter()
+            try:
+                boxes = self.tracker(frame, captured_at) if self.tracker else self.detect_fn(frame)
+            except Exception as e:
+                logger.error(f"Frame Processing Error: {e}")
+                boxes = []
+            self.inference_ms.observe((time.perf_counter() - started) * 1000)
+            self.rates["inference"].mark()
+            if _put_latest(self.results, (seq, captured_at, frame, boxes)):
+                self.dropped["queue_full"] += 1
+        self._finish_flight()
+
+    def _finish_flight(self):
+        """Stores the tracker's per-flight summary and starts counting afresh."""
+        if not self.tracker or not self.tracker.keyframes:
+            return
+        stats = self.tracker.stats()
+        self.tracker.reset()
+        db = SessionLocal()
+        try:
+            db.add(models.FlightSummary(
+                source=self.source,
+                user_name=self.user_name,
+                started_at=self.flight_started_at,
+                ended_at=datetime.utcnow(),
+                frames_analysed=stats["frames"],
+                keyframes=stats["keyframes"],
+                unique_pests=stats["unique_pests"],
+                peak_visible=stats["peak_visible"],
+                max_confidence=stats["max_confidence"],
+                mean_track_s=stats["mean_track_s"],
+            ))
+            db.commit()
+            self.flights_recorded += 1
+            logger.info(f"Flight over {self.source}: {stats['unique_pests']} unique pests "
+                        f"({stats['keyframes']}/{stats['frames']} frames detected)")
+        except Exception as e:
+            logger.error(f"Failed to store flight summary: {e}")
+        finally:
+            db.close()
+
+    def _encode(self):
+        import cv2
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+        while not self._stop.is_set():
+            try:
+                seq, captured_at, frame, boxes = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if seq <= self._published_seq:
+                self.dropped["out_of_order"] += 1  # a later frame already went out (parallel workers)
+                continue
+            ok, buffer = cv2.imencode(".jpg", draw_boxes(frame, boxes), params)
+            if not ok:
+                continue
+            latency = time.monotonic() - captured_at
+            self.latency_ms.observe(latency * 1000)
+            self.rates["encode"].mark()
+            self._adapt(latency)
+            self._published_seq = seq
+            self._latest = (seq, buffer.tobytes())
+            self._notify()
+
+    def _adapt(self, latency):
+        """Backs off the emit rate while latency is over budget, recovers towards the target otherwise."""
+        floor = 1.0 / self.target_fps
+        if latency > self.max_latency:
+            self.emit_interval = min(self.emit_interval * 1.25, 2.0)
+        elif latency < self.max_latency / 2 and self.frames.empty():
+            self.emit_interval = max(floor, self.emit_interval * 0.95)
+
+    # --- Viewers (asyncio side) ---
+    def _notify(self):
+        with self._viewers_lock:
+            viewers = list(self._viewers.items())
+        for event, loop in viewers:
+            loop.call_soon_threadsafe(event.set)
+
+    async def frames_for_viewer(self):
+        """Yields multipart JPEG chunks; every viewer sees the latest frame, slow viewers skip frames."""
+        event = asyncio.Event()
+        with self._viewers_lock:
+            self._viewers[event] = asyncio.get_running_loop()
+            self.idle_since = None
+        last_seq = 0
+        try:
+            while self.running:
+                await event.wait()
+                event.clear()
+                seq, jpeg = self._latest
+                if jpeg is None or seq == last_seq:
+                    continue
+                last_seq = seq
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            with self._viewers_lock:
+                self._viewers.pop(event, None)
+                if not self._viewers:
+                    self.idle_since = time.monotonic()
+
+    def stats(self):
+        with self._viewers_lock:
+            viewers = len(self._viewers)
+        return {
+            "source": self.source,
+            "viewers": viewers,
+            "fps": {stage: meter.rate() for stage, meter in self.rates.items()},
+            "target_fps": self.target_fps,
+            "effective_fps_cap": round(1.0 / self.emit_interval, 2),
+            "queue_depth": {"frames": self.frames.qsize(), "results": self.results.qsize()},
+            "dropped": dict(self.dropped),
+            "latency_ms": self.latency_ms.snapshot(),
+            "inference_ms": self.inference_ms.snapshot(),
+            "tracking": dict(self.tracker.stats(), flights_recorded=self.flights_recorded) if self.tracker else None,
+        }
+
+class VideoHub:
+    """Keeps one VideoPipeline per source; idle pipelines are reaped when a new viewer arrives."""
+
+    def __init__(self, idle_timeout=VIDEO_IDLE_TIMEOUT_S):
+        self.idle_timeout = idle_timeout
+        self._pipelines = {}
+        self._lock = threading.Lock()
+
+    def _reap_idle(self):
+        now = time.monotonic()
+        for source, pipeline in list(self._pipelines.items()):
+            idle = pipeline.idle_since is not None and now - pipeline.idle_since > self.idle_timeout
+            if idle or not pipeline.running:
+                pipeline.stop()
+                del self._pipelines[source]
+
+    def pipeline(self, source: str, detect_fn, user_name: str = None) -> VideoPipeline:
+        with self._lock:
+            self._reap_idle()
+            pipeline = self._pipelines.get(source)
+            if pipeline is None:
+                pipeline = self._pipelines[source] = VideoPipeline(source, detect_fn, user_name=user_name)
+                pipeline.start()
+            return pipeline
+
+    async def stream(self, source: str, detect_fn, user_name: str = None):
+        async for chunk in self.pipeline(source, detect_fn, user_name).frames_for_viewer():
+            yield chunk
+
+    async def reaper(self, interval: float = None):
+        """Background task: stops pipelines nobody has watched for idle_timeout."""
+        while True:
+            await asyncio.sleep(interval or self.idle_timeout)
+            with self._lock:
+                self._reap_idle()
+
+    def shutdown(self):
+        with self._lock:
+            for pipeline in self._pipelines.values():
+                pipeline.stop(wait=True)
+            self._pipelines.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"pipelines": [p.stats() for p in self._pipelines.values()]}
+
+video_hub = VideoHub()
@@ -1,16 +1,186 @@
 import os
-import httpx
+import time
+import asyncio
 from dotenv import load_dotenv
 import logging
+from services.http_client import http_registry
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+# Overridable so integrations can be exercised against a local stub server
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org")
+
+# Weather is shared by every scan in a grid cell: 0.1 deg is roughly an 11 km square
+WEATHER_GRID_DEG = float(os.getenv("WEATHER_GRID_DEG", "0.1"))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "3600"))
+# Past the TTL an entry is still served (and refreshed in the background) up to this age
+WEATHER_CACHE_STALE_TTL = float(os.getenv("WEATHER_CACHE_STALE_TTL", "21600"))
+WEATHER_CACHE_PERSIST = os.getenv("WEATHER_CACHE_PERSIST", "1") == "1"
+
+class WeatherCache:
+    """
+    TTL cache for weather lookups keyed by a rounded lat/lon grid cell.
+
+    - Single-flight: concurrent misses for one cell share one upstream call.
+    - Stale-while-revalidate: expired entries are returned immediately while
+      a background refresh runs.
+    - Entries are persisted to the SQLite `weather_cache` table so a restart
+      does not cold-start every cell.
+    """
+
+    def __init__(self, fetch_fn, ttl=WEATHER_CACHE_TTL, stale_ttl=WEATHER_CACHE_STALE_TTL,
+                 grid_deg=WEATHER_GRID_DEG, persist=WEATHER_CACHE_PERSIST):
+        self.fetch_fn = fetch_fn
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.grid_deg = grid_deg
+        self.persist = persist
+        self._entries = {}   # cell key -> (fetched_at, data)
+        self._inflight = {}  # cell key -> asyncio.Task
+        self._loading = {}   # cell key -> asyncio.Task (cold-start DB lookup)
+        self._checked_db = set()
+        self.counters = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+            "upstream_calls": 0, "upstream_errors": 0, "db_loads": 0,
+        }
+
+    def cell(self, lat: float, lon: float):
+        """Returns (key, cell-centre lat, cell-centre lon) for a coordinate."""
+        row, col = round(lat / self.grid_deg), round(lon / self.grid_deg)
+        return f"{row}:{col}", round(row * self.grid_deg, 4), round(col * self.grid_deg, 4)
+
+    async def get(self, lat: float, lon: float):
+        key, clat, clon = self.cell(lat, lon)
+
+        entry = self._entries.get(key)
+        if entry is None and self.persist and key not in self._checked_db:
+            # Single-flight too: concurrent first requests share one DB read, then one upstream call
+            entry = await asyncio.shield(self._load(key))
+
+        if entry is not None:
+            fetched_at, data = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.counters["hits"] += 1
+                return data
+            if age < self.stale_ttl:
+                self.counters["stale_hits"] += 1
+                self._refresh(key, clat, clon)
+                return data
+
+        self.counters["misses"] += 1
+        if key in self._inflight:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(self._refresh(key, clat, clon))
+
+    def _load(self, key):
+        """Starts (or joins) the one DB lookup for a cell not yet seen by this process."""
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load_from_db(key))
+            self._loading[key] = task
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        return task
+
+    async def _load_from_db(self, key):
+        try:
+            entry = await asyncio.to_thread(_load_entry, key)
+        except Exception as e:
+            logger.error(f"[Weather] Cache load failed: {e}")
+            entry = None
+        self._checked_db.add(key)
+        if entry is not None:
+            self.counters["db_loads"] += 1
+            self._entries.setdefault(key, entry)
+        return self._entries.get(key)
+
+    def _refresh(self, key, lat, lon):
+        """Starts (or joins) the single in-flight upstream fetch for a cell."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(key, lat, lon))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        # Background revalidations have no awaiting caller; surface their errors here
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"[Weather] Refresh for cell {key} failed: {task.exception()}")
+
+    async def _fetch(self, key, lat, lon):
+        self.counters["upstream_calls"] += 1
+        try:
+            data = await self.fetch_fn(lat, lon)
+        except Exception:
+            self.counters["upstream_errors"] += 1
+            raise
+        entry = (time.time(), data)
+        self._entries[key] = entry
+        if self.persist:
+            try:
+                await asyncio.to_thread(_store_entry, key, *entry)
+            except Exception as e:
+                logger.error(f"[Weather] Cache persist failed: {e}")
+        return data
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["stale_hits"] + self.counters["misses"]
+        served = self.counters["hits"] + self.counters["stale_hits"]
+        return {
+            "grid_deg": self.grid_deg,
+            "ttl_s": self.ttl,
+            "stale_ttl_s": self.stale_ttl,
+            "cells": len(self._entries),
+            "inflight": len(self._inflight),
+            "hit_ratio": round(served / lookups, 4) if lookups else None,
+            **self.counters,
+        }
+
+def _load_entry(key):
+    from database import SessionLocal
+    import models
+    db = SessionLocal()
+    try:
+        row = db.get(models.WeatherCacheEntry, key)
+        return (row.fetched_at, row.payload) if row else None
+    finally:
+        db.close()
+
+def _store_entry(key, fetched_at, data):
+    from database import SessionLocal
+    import models
+    db = SessionLocal()
+    try:
+        db.merge(models.WeatherCacheEntry(cell_key=key, fetched_at=fetched_at, payload=data))
+        db.commit()
+    finally:
+        db.close()
+
+async def _fetch_openweather(lat: float, lon: float):
+    """Single upstream call. Raises on failure so errors are never cached."""
+    url = f"{OPENWEATHER_BASE_URL}/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
+    resp = await http_registry.get(url)
+    if resp.status_code != 200:
+        raise RuntimeError(f"API Error: {resp.status_code} - {resp.text}")
+    data = resp.json()
+    weather = {
+        "temp": data['main']['temp'],
+        "humidity": data['main']['humidity'],
+        "condition": data['weather'][0]['main'], # e.g. Rain, Clear, Clouds
+        "description": data['weather'][0]['description']
+    }
+    logger.info(f"[Weather] Fetched: {weather}")
+    return weather
+
+weather_cache = WeatherCache(_fetch_openweather)
 
 async def get_real_weather(lat: float, lon: float):
     """
-    Fetches real-time weather from OpenWeatherMap. 
+    Fetches real-time weather from OpenWeatherMap (through the grid-cell cache). 
     Returns dict with temp, humidity, condition.
     Falls back to Mock Data if API fails.
     """
@@ -19,26 +189,8 @@ async def get_real_weather(lat: float, lon: float):
         logger.warning("[Weather] No valid API Key. Using Mock Data.")
         return _mock_weather()
 
-    # API Endpoint
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, timeout=5.0)
-            if resp.status_code == 200:
-                data = resp.json()
-                weather = {
-                    "temp": data['main']['temp'],
-                    "humidity": data['main']['humidity'],
-                    "condition": data['weather'][0]['main'], # e.g. Rain, Clear, Clouds
-                    "description": data['weather'][0]['description']
-                }
-                logger.info(f"[Weather] Fetched: {weather}")
-                return weather
-            else:
-                logger.error(f"[Weather] API Error: {resp.status_code} - {resp.text}")
-                return _mock_weather()
-                
+        return await weather_cache.get(lat, lon)
     except Exception as e:
         logger.error(f"[Weather] Connection failed: {e}")
         return _mock_weather()
@@ -0,0 +1,21 @@
+import numpy as np
+from services.farmvibes_yield import farmvibes_engine
+
+def test_scalar_batch_matches_scalar_path():
+    expected = farmvibes_engine.predict_yield(62.0, 2, 36.0, 85.0, "Low", "Optimal")
+    for health in (62.0, np.float64(62.0), np.array(62.0)):
+        batch = farmvibes_engine.predict_yield_batch(health, 2, 36.0, 85.0, "Low", "Optimal")
+        assert batch["amount"].shape == (1,)
+        assert batch["amount"][0] == expected["amount"]
+        assert batch["trend"][0] == expected["trend"]
+
+def test_scalars_broadcast_against_arrays():
+    batch = farmvibes_engine.predict_yield_batch([40.0, 90.0], 0, 28.0, 60.0, "Optimal", ["Low", "Optimal"])
+    for i, (health, k_level) in enumerate(((40.0, "Low"), (90.0, "Optimal"))):
+        expected = farmvibes_engine.predict_yield(health, 0, 28.0, 60.0, "Optimal", k_level)
+        assert batch["amount"][i] == expected["amount"]
+
+if __name__ == "__main__":
+    test_scalar_batch_matches_scalar_path()
+    test_scalars_broadcast_against_arrays()
+    print("farmvibes_yield batch tests passed")
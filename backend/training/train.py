@@ -1,5 +1,8 @@
 from ultralytics import YOLO
 import os
+import glob
+import sys
+import argparse
 
 def train_model():
     # 1. Load a model
@@ -28,8 +31,8 @@ def train_model():
     print(f"mAP50: {metrics.box.map50}")
     
     # 4. Export
-    # Export the model to ONNX or TFLite for deployment (optional)
-    # success = model.export(format='onnx')
+    # CPU deployment formats for the backend's ONNX Runtime / OpenVINO engines
+    export_model(os.path.join('runs/train/yolov8n_wheat_v1/weights', 'best.pt'))
     
     # --- Note on Switching Datasets ---
     # If you want to train on PlantVillage (Diseases):
@@ -37,7 +40,69 @@ def train_model():
     # 2. Change the project name above to 'yolov8n_plant_disease'.
     # 3. Ensure your data/ directory has the PlantVillage images/labels.
 
+def calibration_images(data_yaml='wheat_config.yaml', limit=100):
+    """Validation images used to calibrate INT8 activation ranges."""
+    import yaml
+    with open(data_yaml) as f:
+        config = yaml.safe_load(f)
+    val_dir = os.path.join(config['path'], config['val'])
+    return sorted(glob.glob(os.path.join(val_dir, '*.jpg')))[:limit]
+
+def quantize_onnx_int8(onnx_path, data_yaml='wheat_config.yaml', imgsz=640):
+    """Static INT8 (QDQ) quantization for ONNX Runtime, calibrated on validation images."""
+    import cv2
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    # Same letterboxing as the server's ONNX backend, so calibration sees serving-time inputs
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from services.inference_backends import _LetterboxBuffer
+
+    class ValImages(CalibrationDataReader):
+        def __init__(self, paths, input_name):
+            self.paths = iter(paths)
+            self.input_name = input_name
+            self.buffer = _LetterboxBuffer(1, imgsz)
+
+        def get_next(self):
+            path = next(self.paths, None)
+            if path is None:
+                return None
+            self.buffer.fill([cv2.imread(path)])
+            return {self.input_name: self.buffer.array.copy()}
+
+    import onnxruntime as ort
+    input_name = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    int8_path = onnx_path.replace('.onnx', '_int8.onnx')
+    quantize_static(onnx_path, int8_path, ValImages(calibration_images(data_yaml), input_name),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    return int8_path
+
+def export_model(weights, imgsz=640, int8=False, data_yaml='wheat_config.yaml'):
+    """
+    Exports trained weights for CPU serving. Point MODEL_PATH at any output:
+    best.onnx (ONNX Runtime), best_openvino_model/ (OpenVINO), or the _int8 variants.
+    """
+    model = YOLO(weights)
+    exported = []
+    # Dynamic batch so the server's micro-batching queue can feed several images at once
+    onnx_path = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+    exported.append(onnx_path)
+    # OpenVINO IR; with int8=True ultralytics runs NNCF post-training quantization on `data`
+    exported.append(model.export(format='openvino', imgsz=imgsz, int8=int8, data=data_yaml))
+    if int8:
+        exported.append(quantize_onnx_int8(onnx_path, data_yaml, imgsz))
+    for path in exported:
+        print(f"Exported: {path}")
+    return exported
+
 if __name__ == '__main__':
     # Ensure this runs in the correct directory context
     # Usually you run this from the folder containing the script
-    train_model()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--export', metavar='WEIGHTS', help='skip training and only export these weights')
+    parser.add_argument('--int8', action='store_true', help='also produce INT8-quantized exports')
+    args = parser.parse_args()
+    if args.export:
+        export_model(args.export, int8=args.int8)
+    else:
+        train_model()
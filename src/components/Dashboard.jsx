@@ -45,7 +45,16 @@ const Dashboard = () => {
 
     const weather = isConnected && apiStats ? apiStats.weather : mockWeather;
 
-    const handleScanClick = (scan) => {
+    const handleScanClick = async (listedScan) => {
+        // The list only carries summary fields; load the full scan (action plan, detections) for the report
+        let scan = listedScan;
+        try {
+            const response = await api.get(`/scans/${listedScan.id}`);
+            scan = response.data;
+        } catch (error) {
+            console.error("Failed to fetch scan details", error);
+        }
+
         // Adapt backend scan object to the format expected by AnalysisReport
         // Detailed mapping is crucial here
         const adaptedScan = {
@@ -67,7 +76,9 @@ const Dashboard = () => {
 
             pest_count: scan.result?.pest_detected_count,
             action_plan: scan.result?.raw_json_output?.action_plan || [],
-            ...scan.result?.raw_json_output // Spread the raw JSON just in case
+            ...scan.result?.raw_json_output, // Spread the raw JSON just in case
+            // Detections are stored in their own table and returned next to the result
+            pest_detections: scan.detections || scan.result?.raw_json_output?.pest_detections || []
         };
 
         setSelectedScan(adaptedScan);